@@ -0,0 +1,191 @@
+import asyncio
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from fastapi import HTTPException
+
+from rina_engine import Saturated, REQUEST_TIMEOUT
+from rina_provider_router import NoBackendAvailable
+from rina_quota import QuotaExceeded
+
+logger = logging.getLogger("rina.batch")
+
+# Configuration
+MAX_BATCH_ITEMS = int(os.getenv("RINA_BATCH_MAX_ITEMS", "1000"))
+BATCH_CONCURRENCY = int(os.getenv("RINA_BATCH_CONCURRENCY", "8"))
+BATCH_ITEM_TIMEOUT = float(os.getenv("RINA_BATCH_ITEM_TIMEOUT", str(REQUEST_TIMEOUT)))
+BATCH_RETRIES = int(os.getenv("RINA_BATCH_RETRIES", "2"))
+BATCH_JOB_TTL = float(os.getenv("RINA_BATCH_JOB_TTL", "3600"))
+MAX_BATCH_JOBS = int(os.getenv("RINA_MAX_BATCH_JOBS", "32"))
+
+RunItem = Callable[[Any], Awaitable[Dict[str, Any]]]
+
+
+def clamp_concurrency(requested: Any) -> int:
+    try:
+        return max(1, min(int(requested), BATCH_CONCURRENCY))
+    except (TypeError, ValueError):
+        return BATCH_CONCURRENCY
+
+
+def _item_error(exc: Exception):
+    if isinstance(exc, HTTPException):
+        return exc.status_code, exc.detail
+    if isinstance(exc, (Saturated, QuotaExceeded)):
+        return exc.status_code, str(exc)
+    if isinstance(exc, NoBackendAvailable):
+        return 503, str(exc)
+    if isinstance(exc, asyncio.TimeoutError):
+        return 504, "Upstream model timed out"
+    return 500, "Internal server error"
+
+
+async def _run_one(index: int, item: Any, run_item: RunItem) -> Dict[str, Any]:
+    item_id = item.get("id", index) if isinstance(item, dict) else index
+    attempt = 0
+    while True:
+        try:
+            result = await asyncio.wait_for(run_item(item), BATCH_ITEM_TIMEOUT)
+            return {"index": index, "id": item_id, "status": 200, **result}
+        except (Saturated, QuotaExceeded) as exc:
+            # Bulk work can afford to wait out a busy lane or rate limit instead of failing the item.
+            if attempt < BATCH_RETRIES:
+                attempt += 1
+                await asyncio.sleep(exc.retry_after)
+                continue
+            status, detail = _item_error(exc)
+        except Exception as exc:
+            status, detail = _item_error(exc)
+            if status == 500:
+                logger.error(f"Batch item {item_id} failed: {exc}")
+        return {"index": index, "id": item_id, "status": status, "error": detail}
+
+
+async def run_batch(items: List[Any], run_item: RunItem,
+                    concurrency: int = BATCH_CONCURRENCY) -> AsyncIterator[Dict[str, Any]]:
+    """Run ``items`` with at most ``concurrency`` in flight; yield results in completion order.
+
+    Every item yields exactly one result, ``{"index", "id", "status", ...}``,
+    carrying either the ``run_item`` fields or an ``error``. Closing the
+    iterator early cancels the items still running.
+    """
+    source = iter(enumerate(items))
+    pending = set()
+
+    def launch():
+        for index, item in source:
+            pending.add(asyncio.ensure_future(_run_one(index, item, run_item)))
+            if len(pending) >= concurrency:
+                return
+
+    launch()
+    try:
+        while pending:
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            pending.difference_update(done)
+            launch()
+            for task in done:
+                yield task.result()
+    finally:
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+
+class BatchJob:
+    def __init__(self, total: int):
+        self.id = uuid.uuid4().hex
+        self.total = total
+        self.results: List[Dict[str, Any]] = []
+        self.failed = 0
+        self.status = "running"
+        self.created = time.time()
+        self.finished: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+
+    def snapshot(self, offset: int = 0) -> Dict[str, Any]:
+        """Job progress plus results from ``offset`` on, for incremental polling."""
+        offset = max(0, offset)
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "total": self.total,
+            "completed": len(self.results),
+            "failed": self.failed,
+            "created": self.created,
+            "finished": self.finished,
+            "results": self.results[offset:],
+            "next_offset": len(self.results),
+        }
+
+
+class BatchJobStore:
+    """Background batch jobs, kept for ``BATCH_JOB_TTL`` seconds after they finish."""
+
+    def __init__(self):
+        self._jobs: "OrderedDict[str, BatchJob]" = OrderedDict()
+
+    def submit(self, items: List[Any], run_item: RunItem, concurrency: int = BATCH_CONCURRENCY) -> BatchJob:
+        self._expire()
+        running = sum(1 for job in self._jobs.values() if job.status == "running")
+        if running >= MAX_BATCH_JOBS:
+            raise HTTPException(status_code=429, detail="Too many batch jobs running")
+        job = BatchJob(len(items))
+        job.task = asyncio.ensure_future(self._run(job, items, run_item, concurrency))
+        job.task.add_done_callback(lambda _: self._settle(job))
+        self._jobs[job.id] = job
+        return job
+
+    async def _run(self, job: BatchJob, items: List[Any], run_item: RunItem, concurrency: int):
+        try:
+            async for result in run_batch(items, run_item, concurrency):
+                job.results.append(result)
+                if result["status"] != 200:
+                    job.failed += 1
+            job.status = "completed"
+        except asyncio.CancelledError:
+            job.status = "cancelled"
+        except Exception as exc:
+            logger.error(f"Batch job {job.id} failed: {exc}")
+            job.status = "failed"
+        finally:
+            job.finished = time.time()
+
+    @staticmethod
+    def _settle(job: BatchJob):
+        # A job cancelled before it ever ran never reaches _run's handlers.
+        if job.status == "running":
+            job.status = "cancelled"
+        if job.finished is None:
+            job.finished = time.time()
+
+    def get(self, job_id: str) -> Optional[BatchJob]:
+        self._expire()
+        return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[BatchJob]:
+        job = self.get(job_id)
+        if job is not None and job.task is not None and not job.task.done():
+            job.task.cancel()
+        return job
+
+    def _expire(self):
+        cutoff = time.time() - BATCH_JOB_TTL
+        for job_id, job in list(self._jobs.items()):
+            if job.finished is not None and job.finished < cutoff:
+                del self._jobs[job_id]
+
+    async def shutdown(self):
+        tasks = [job.task for job in self._jobs.values() if job.task is not None and not job.task.done()]
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+batch_jobs = BatchJobStore()
@@ -0,0 +1,463 @@
+"""Offline load test for the Ollama bridge.
+
+Starts rina_mock_ollama in a subprocess and runs ``server.app`` in this
+process. A load client, in a subprocess of its own, drives /chat, /sse,
+/ws/ai and /vision at the chosen concurrency, so the event-loop lag and
+RSS sampled here are the app's alone. For each route it reports latency
+percentiles, time to first token, throughput, event-loop lag and RSS,
+and it can save the results as JSON to compare runs across commits::
+
+    python rina_bench.py --requests 200 --concurrency 16 --output bench.json
+    python rina_bench.py --compare bench.json
+"""
+import argparse
+import asyncio
+import base64
+import json
+import math
+import os
+import platform
+import socket
+import struct
+import subprocess
+import sys
+import time
+import zlib
+from typing import Any, Dict, List, Optional
+
+ROUTES = ("chat", "sse", "ws", "vision")
+
+
+def solid_png(size: int = 64) -> bytes:
+    """A plain RGB PNG built by hand, so the client side needs no Pillow."""
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    rows = b"".join(b"\x00" + b"\xcc\x22\x22" * size for _ in range(size))
+    header = struct.pack(">IIBBBBB", size, size, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(rows)) + chunk(b"IEND", b"")
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100.0 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(values: List[float], scale: float = 1000.0) -> Dict[str, Optional[float]]:
+    def r(v):
+        return None if v is None else round(v * scale, 2)
+
+    return {
+        "p50": r(percentile(values, 50)),
+        "p95": r(percentile(values, 95)),
+        "p99": r(percentile(values, 99)),
+        "max": r(max(values) if values else None),
+    }
+
+
+def rss_mb() -> Optional[float]:
+    """RSS of this process, the one serving the app."""
+    try:
+        with open("/proc/self/statm") as f:
+            return round(int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20, 1)
+    except (OSError, ValueError):
+        return None
+
+
+class LoopMonitor:
+    """Samples event-loop lag (and RSS) on the loop serving the app."""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.lags: List[float] = []
+        self.rss: List[float] = []
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        ticks = 0
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            self.lags.append(max(0.0, loop.time() - started - self.interval))
+            ticks += 1
+            if ticks % 10 == 0:
+                current = rss_mb()
+                if current is not None:
+                    self.rss.append(current)
+
+    def start(self):
+        self.lags, self.rss = [], []
+        self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+
+class Sample:
+    __slots__ = ("ok", "latency", "ttft", "tokens", "error")
+
+    def __init__(self):
+        self.ok = False
+        self.latency = 0.0
+        self.ttft: Optional[float] = None
+        self.tokens = 0
+        self.error: Optional[str] = None
+
+
+class LoadClient:
+    """Issues benchmark requests; runs in the client subprocess (see ``client_main``)."""
+
+    def __init__(self, base_url: str, provider: str, concurrency: int):
+        import httpx
+
+        self.base_url = base_url
+        self.ws_url = base_url.replace("http://", "ws://", 1) + "/ws/ai"
+        self.provider = provider
+        self.concurrency = concurrency
+        self.http = httpx.AsyncClient(
+            base_url=base_url,
+            timeout=httpx.Timeout(300.0),
+            limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency),
+        )
+        self.image = "data:image/png;base64," + base64.b64encode(solid_png()).decode("ascii")
+
+    async def chat(self, prompt: str, sample: Sample, _state):
+        response = await self.http.post("/chat", json={"content": prompt, "provider": self.provider})
+        if response.status_code != 200:
+            sample.error = str(response.status_code)
+            return
+        sample.tokens = response.json()["usage"]["completion_tokens"] or 0
+        sample.ok = True
+
+    async def vision(self, prompt: str, sample: Sample, _state):
+        response = await self.http.post("/vision", json={"image": self.image, "prompt": prompt, "provider": self.provider})
+        if response.status_code != 200:
+            sample.error = str(response.status_code)
+            return
+        sample.tokens = response.json()["usage"]["completion_tokens"] or 0
+        sample.ok = True
+
+    async def sse(self, prompt: str, sample: Sample, _state):
+        started = time.perf_counter()
+        params = {"content": prompt, "provider": self.provider}
+        async with self.http.stream("GET", "/sse", params=params) as response:
+            if response.status_code != 200:
+                sample.error = str(response.status_code)
+                return
+            error_event = False
+            async for line in response.aiter_lines():
+                if line.startswith("event: error"):
+                    error_event = True
+                elif line.startswith("data:") and error_event:
+                    sample.error = str(json.loads(line[5:]).get("status", "error"))
+                    return
+                elif line.startswith("data:"):
+                    if sample.ttft is None:
+                        sample.ttft = time.perf_counter() - started
+                    sample.tokens += 1
+        sample.ok = True
+
+    async def ws(self, prompt: str, sample: Sample, state: Dict[str, Any]):
+        import websockets
+
+        if state.get("ws") is None:
+            state["ws"] = await websockets.connect(self.ws_url, max_size=None)
+        connection = state["ws"]
+        started = time.perf_counter()
+        await connection.send(json.dumps({"type": "generate", "id": "bench", "content": prompt,
+                                          "provider": self.provider}))
+        while True:
+            frame = json.loads(await connection.recv())
+            if frame["type"] == "token":
+                if sample.ttft is None:
+                    sample.ttft = time.perf_counter() - started
+                # Frames batch several tokens; the mock's tokens are whitespace-separated.
+                sample.tokens += len(frame["text"].split())
+            elif frame["type"] == "done":
+                sample.ok = frame.get("finish_reason") == "stop"
+                return
+            elif frame["type"] == "error":
+                sample.error = str(frame.get("status", "error"))
+                return
+
+    async def run(self, route: str, total: int, tag: str) -> Dict[str, Any]:
+        call = getattr(self, route)
+        samples: List[Sample] = []
+        counter = iter(range(total))
+
+        async def worker(worker_id: int):
+            state: Dict[str, Any] = {}
+            try:
+                for i in counter:
+                    sample = Sample()
+                    started = time.perf_counter()
+                    try:
+                        # Unique prompts, so the cache and request coalescing stay out of the numbers.
+                        await call(f"bench {tag} {route} {worker_id} {i}", sample, state)
+                    except Exception as exc:
+                        sample.error = type(exc).__name__
+                        state.pop("ws", None)
+                    sample.latency = time.perf_counter() - started
+                    samples.append(sample)
+            finally:
+                if state.get("ws") is not None:
+                    await state["ws"].close()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(n) for n in range(self.concurrency)))
+        elapsed = time.perf_counter() - started
+
+        ok = [s for s in samples if s.ok]
+        errors: Dict[str, int] = {}
+        for s in samples:
+            if not s.ok:
+                errors[s.error or "unknown"] = errors.get(s.error or "unknown", 0) + 1
+        return {
+            "requests": len(samples),
+            "ok": len(ok),
+            "errors": errors,
+            "elapsed_s": round(elapsed, 3),
+            "throughput_rps": round(len(ok) / elapsed, 2) if elapsed else None,
+            "tokens_per_s": round(sum(s.tokens for s in ok) / elapsed, 1) if elapsed else None,
+            "latency_ms": summarize([s.latency for s in ok]),
+            "ttft_ms": summarize([s.ttft for s in ok if s.ttft is not None]) if route in ("sse", "ws") else None,
+        }
+
+    async def aclose(self):
+        await self.http.aclose()
+
+
+async def run_client(base_url: str, provider: str, concurrency: int, route: str, total: int,
+                     tag: str) -> Dict[str, Any]:
+    """Run one route's load in a client subprocess and return its results."""
+    command = [
+        sys.executable, os.path.abspath(__file__), "--client", route,
+        "--base-url", base_url,
+        "--provider", provider,
+        "--concurrency", str(concurrency),
+        "--requests", str(total),
+        "--tag", tag,
+    ]
+    process = await asyncio.create_subprocess_exec(*command, stdout=subprocess.PIPE)
+    stdout, _ = await process.communicate()
+    if process.returncode != 0:
+        raise RuntimeError(f"load client for {route} exited with {process.returncode}")
+    return json.loads(stdout)
+
+
+def client_main(args):
+    async def go():
+        client = LoadClient(args.base_url, args.provider, args.concurrency)
+        try:
+            return await client.run(args.client, args.requests, args.tag)
+        finally:
+            await client.aclose()
+
+    print(json.dumps(asyncio.run(go())), flush=True)
+
+
+def start_mock(args, port: int) -> subprocess.Popen:
+    command = [
+        sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "rina_mock_ollama.py"),
+        "--port", str(port),
+        "--latency", str(args.mock_latency),
+        "--token-rate", str(args.mock_token_rate),
+        "--tokens", str(args.mock_tokens),
+        "--failure-rate", str(args.mock_failure_rate),
+        "--seed", str(args.seed),
+    ]
+    return subprocess.Popen(command)
+
+
+def wait_for(url: str, timeout: float = 30.0):
+    import httpx
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url, timeout=1.0).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.1)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def benchmark(args) -> Dict[str, Any]:
+    mock_port, app_port = free_port(), free_port()
+    mock_url = f"http://127.0.0.1:{mock_port}"
+
+    # The bridge reads its configuration at import time.
+    os.environ.update({
+        "LITELLM_LOCAL_MODEL_COST_MAP": "True",
+        "RINA_OLLAMA_BACKENDS": mock_url,
+        "OPENAI_API_BASE": f"{mock_url}/v1",
+        "OPENAI_API_KEY": os.environ.get("OPENAI_API_KEY", "bench"),
+        "REQUIRE_VALID_LICENSE": "false",
+        "RINA_CACHE_ENABLED": "false",
+        "RINA_QUOTA_ENABLED": "false",
+    })
+    for option in args.env:
+        key, _, value = option.partition("=")
+        os.environ[key] = value
+
+    mock = start_mock(args, mock_port)
+    try:
+        await asyncio.to_thread(wait_for, f"{mock_url}/api/tags")
+
+        import logging
+        import uvicorn
+        from server import app
+
+        import litellm
+
+        litellm.suppress_debug_info = True
+        logging.getLogger("rina").setLevel(logging.WARNING)
+        logging.getLogger("LiteLLM").setLevel(logging.WARNING)
+        server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=app_port, log_level="warning"))
+        serving = asyncio.ensure_future(server.serve())
+        base_url = f"http://127.0.0.1:{app_port}"
+        await asyncio.to_thread(wait_for, f"{base_url}/health")
+
+        monitor = LoopMonitor()
+        results: Dict[str, Any] = {}
+        rss_start = rss_mb()
+        tag = str(int(time.time()))
+        for route in args.routes:
+            if args.warmup:
+                await run_client(base_url, args.provider, args.concurrency, route, args.warmup, f"warmup-{tag}")
+            monitor.start()
+            result = await run_client(base_url, args.provider, args.concurrency, route, args.requests, tag)
+            await monitor.stop()
+            result["event_loop_lag_ms"] = summarize(monitor.lags)
+            result["rss_mb"] = {"peak": max(monitor.rss, default=rss_mb()), "end": rss_mb()}
+            results[route] = result
+            print_route(route, result)
+
+        server.should_exit = True
+        await serving
+    finally:
+        mock.terminate()
+        mock.wait(timeout=10)
+
+    return {
+        "meta": {
+            "revision": git_revision(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "provider": args.provider,
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "mock": {
+                "latency_s": args.mock_latency,
+                "token_rate": args.mock_token_rate,
+                "tokens": args.mock_tokens,
+                "failure_rate": args.mock_failure_rate,
+            },
+            "rss_start_mb": rss_start,
+        },
+        "routes": results,
+    }
+
+
+def print_route(route: str, result: Dict[str, Any]):
+    latency, ttft, lag = result["latency_ms"], result["ttft_ms"], result["event_loop_lag_ms"]
+    line = (f"{route:>6}: {result['ok']}/{result['requests']} ok  {result['throughput_rps']} req/s  "
+            f"{result['tokens_per_s']} tok/s  latency p50/p95/p99 {latency['p50']}/{latency['p95']}/{latency['p99']} ms")
+    if ttft:
+        line += f"  ttft p50/p95 {ttft['p50']}/{ttft['p95']} ms"
+    line += f"  loop lag p99 {lag['p99']} ms  rss peak {result['rss_mb']['peak']} MB"
+    if result["errors"]:
+        line += f"  errors {result['errors']}"
+    print(line, flush=True)
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any]):
+    """Print per-route changes against a saved run."""
+    print(f"\nvs {baseline['meta'].get('revision')} ({baseline['meta'].get('timestamp')}):")
+    metrics = (("throughput_rps", None), ("latency_ms", "p50"), ("latency_ms", "p95"), ("latency_ms", "p99"),
+               ("ttft_ms", "p50"), ("ttft_ms", "p95"), ("event_loop_lag_ms", "p99"))
+    for route, result in current["routes"].items():
+        old = baseline["routes"].get(route)
+        if old is None:
+            continue
+        parts = []
+        for metric, field in metrics:
+            before, after = old.get(metric), result.get(metric)
+            if field is not None:
+                before = before and before.get(field)
+                after = after and after.get(field)
+            if before is None or after is None:
+                continue
+            change = f"{(after - before) / before * 100:+.1f}%" if before else "n/a"
+            parts.append(f"{metric.replace('_ms', '')}{'.' + field if field else ''} {before} -> {after} ({change})")
+        print(f"{route:>6}: " + ", ".join(parts))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--routes", default=",".join(ROUTES), help=f"comma-separated subset of {','.join(ROUTES)}")
+    parser.add_argument("--requests", type=int, default=100, help="measured requests per route")
+    parser.add_argument("--warmup", type=int, default=8, help="unmeasured requests per route")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--provider", default="local", choices=("local", "openai"),
+                        help="local drives the Ollama API, openai the OpenAI-compatible one")
+    parser.add_argument("--mock-latency", type=float, default=0.05, help="mock seconds to first token")
+    parser.add_argument("--mock-token-rate", type=float, default=50.0, help="mock tokens per second")
+    parser.add_argument("--mock-tokens", type=int, default=32, help="mock tokens per reply")
+    parser.add_argument("--mock-failure-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="extra bridge configuration, e.g. RINA_MAX_CONCURRENCY_PER_MODEL=16")
+    parser.add_argument("--output", help="write results JSON here")
+    parser.add_argument("--compare", help="results JSON from an earlier run to diff against")
+    # Internal: run as the load client subprocess for one route.
+    parser.add_argument("--client", choices=ROUTES, help=argparse.SUPPRESS)
+    parser.add_argument("--base-url", help=argparse.SUPPRESS)
+    parser.add_argument("--tag", default="", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.client:
+        client_main(args)
+        return
+    args.routes = [r.strip() for r in args.routes.split(",") if r.strip()]
+    unknown = set(args.routes) - set(ROUTES)
+    if unknown:
+        parser.error(f"unknown routes: {', '.join(sorted(unknown))}")
+
+    report = asyncio.run(benchmark(args))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"results written to {args.output}")
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
+
+
+if __name__ == "__main__":
+    main()
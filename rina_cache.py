@@ -0,0 +1,277 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+from rina_metrics import CACHE_BYTES, CACHE_EVICTIONS, CACHE_HITS, CACHE_MISSES
+
+logger = logging.getLogger("rina.cache")
+
+# Configuration
+CACHE_ENABLED = os.getenv("RINA_CACHE_ENABLED", "false").lower() == "true"
+CACHE_TTL = float(os.getenv("RINA_CACHE_TTL", "3600"))
+CACHE_MAX_BYTES = int(os.getenv("RINA_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+CACHE_DIR = os.getenv("RINA_CACHE_DIR")  # enables the on-disk tier
+CACHE_DISK_MAX_BYTES = int(os.getenv("RINA_CACHE_DISK_MAX_BYTES", str(1024 * 1024 * 1024)))
+
+CACHE_HEADER = "X-Rina-Cache"
+
+_WHITESPACE = re.compile(r"\s+")
+_DATA_URI = re.compile(r"^data:[^,]*?;base64,", re.IGNORECASE)
+
+
+def _normalize_text(text: str) -> str:
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFC", text)).strip()
+
+
+def _image_digest(url: str) -> str:
+    # Hash the base64 payload, not the data URI, so a different mime label
+    # or line wrapping of the same image still hits.
+    url = url.strip()
+    match = _DATA_URI.match(url)
+    payload = _WHITESPACE.sub("", url[match.end():]) if match else url
+    return "sha256:" + hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _normalize_content(content: Any) -> Any:
+    if isinstance(content, str):
+        return _normalize_text(content)
+    if isinstance(content, list):
+        parts = []
+        for part in content:
+            if not isinstance(part, dict):
+                parts.append(_normalize_content(part))
+            elif part.get("type") == "image_url":
+                image = part.get("image_url")
+                url = image.get("url", "") if isinstance(image, dict) else str(image or "")
+                parts.append({"type": "image", "digest": _image_digest(url)})
+            elif part.get("type") == "text":
+                parts.append({"type": "text", "text": _normalize_text(part.get("text", ""))})
+            else:
+                parts.append(part)
+        return parts
+    return content
+
+
+def normalize_messages(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Canonical form of a chat history for cache keys.
+
+    Roles are lower-cased, text is NFC-normalized with whitespace runs
+    collapsed, images are replaced by a content hash and empty turns are
+    dropped.
+    """
+    normalized = []
+    for message in messages:
+        content = _normalize_content(message.get("content"))
+        if content in ("", None, []):
+            continue
+        normalized.append({"role": str(message.get("role", "user")).lower(), "content": content})
+    return normalized
+
+
+def make_key(model: str, messages: List[Dict[str, Any]], params: Optional[Dict[str, Any]] = None) -> str:
+    canonical = json.dumps(
+        {"model": model, "messages": normalize_messages(messages), "params": params or {}},
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class MemoryTier:
+    """LRU with per-entry TTL and a byte budget."""
+
+    name = "memory"
+
+    def __init__(self, max_bytes: int, ttl: float):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.size = 0
+        self._entries: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[bytes]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires, value = entry
+        if expires < time.time():
+            self._remove(key)
+            CACHE_EVICTIONS.labels(self.name).inc()
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def put(self, key: str, value: bytes, expires: Optional[float] = None):
+        if len(value) > self.max_bytes:
+            return
+        self._remove(key)
+        self._entries[key] = (expires or time.time() + self.ttl, value)
+        self.size += len(value)
+        while self.size > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            CACHE_EVICTIONS.labels(self.name).inc()
+        CACHE_BYTES.labels(self.name).set(self.size)
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= len(entry[1])
+            CACHE_BYTES.labels(self.name).set(self.size)
+
+
+class DiskTier:
+    """SQLite-backed tier that survives restarts; call it from a worker thread."""
+
+    name = "disk"
+
+    def __init__(self, directory: str, max_bytes: int, ttl: float):
+        os.makedirs(directory, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(directory, "responses.sqlite3"), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, expires REAL NOT NULL, accessed REAL NOT NULL,"
+            " size INTEGER NOT NULL, value BLOB NOT NULL)"
+        )
+        self._db.commit()
+        self.size = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        CACHE_BYTES.labels(self.name).set(self.size)
+
+    def get(self, key: str) -> Optional[Tuple[float, bytes]]:
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT expires, value FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if row[0] < now:
+                self._delete(key)
+                self._db.commit()
+                CACHE_EVICTIONS.labels(self.name).inc()
+                return None
+            self._db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self._db.commit()
+            return row[0], row[1]
+
+    def put(self, key: str, value: bytes):
+        now = time.time()
+        with self._lock:
+            self._delete(key)
+            self._db.execute(
+                "INSERT INTO responses (key, expires, accessed, size, value) VALUES (?, ?, ?, ?, ?)",
+                (key, now + self.ttl, now, len(value), value),
+            )
+            self.size += len(value)
+            if self.size > self.max_bytes:
+                self._evict(now)
+            self._db.commit()
+        CACHE_BYTES.labels(self.name).set(self.size)
+
+    def _delete(self, key: str):
+        row = self._db.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is not None:
+            self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self.size -= row[0]
+
+    def _evict(self, now: float):
+        expired = self._db.execute("DELETE FROM responses WHERE expires < ?", (now,)).rowcount
+        CACHE_EVICTIONS.labels(self.name).inc(max(expired, 0))
+        self.size = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        for key, size in self._db.execute("SELECT key, size FROM responses ORDER BY accessed").fetchall():
+            if self.size <= self.max_bytes:
+                break
+            self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self.size -= size
+            CACHE_EVICTIONS.labels(self.name).inc()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class ResponseCache:
+    """Opt-in completion cache: in-process LRU in front of an optional disk tier."""
+
+    def __init__(self, enabled: bool = CACHE_ENABLED, directory: Optional[str] = CACHE_DIR):
+        self.enabled = enabled
+        self.memory = MemoryTier(CACHE_MAX_BYTES, CACHE_TTL)
+        self.disk: Optional[DiskTier] = None
+        if enabled and directory:
+            self.disk = DiskTier(directory, CACHE_DISK_MAX_BYTES, CACHE_TTL)
+
+    @staticmethod
+    def policy(headers: Mapping[str, str]) -> Tuple[bool, bool]:
+        """Return ``(read, write)`` for a request.
+
+        ``X-Rina-Cache: bypass`` or ``Cache-Control: no-cache`` skip the
+        lookup but still refresh the entry; ``no-store`` skips both.
+        """
+        directives = {
+            d.strip().lower()
+            for d in (headers.get("cache-control", "") + "," + headers.get(CACHE_HEADER.lower(), "")).split(",")
+        }
+        if "no-store" in directives:
+            return False, False
+        return not ({"no-cache", "bypass"} & directives), True
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        value = self.memory.get(key)
+        if value is not None:
+            CACHE_HITS.labels(self.memory.name).inc()
+            return json.loads(value)
+        if self.disk is not None:
+            try:
+                entry = await asyncio.to_thread(self.disk.get, key)
+            except sqlite3.Error as exc:
+                # A locked or damaged disk tier degrades to a miss, like a failed write.
+                logger.warning(f"Disk cache read failed: {exc}")
+                entry = None
+            if entry is not None:
+                expires, value = entry
+                CACHE_HITS.labels(self.disk.name).inc()
+                self.memory.put(key, value, expires)
+                return json.loads(value)
+        CACHE_MISSES.inc()
+        return None
+
+    async def put(self, key: str, body: Dict[str, Any]):
+        value = json.dumps(body, separators=(",", ":")).encode("utf-8")
+        self.memory.put(key, value)
+        if self.disk is not None:
+            try:
+                await asyncio.to_thread(self.disk.put, key, value)
+            except sqlite3.Error as exc:
+                logger.warning(f"Disk cache write failed: {exc}")
+
+    async def lookup(self, headers: Mapping[str, str], key: str) -> Tuple[Optional[Dict[str, Any]], str]:
+        """Return ``(cached_body, header_value)`` for a request."""
+        if not self.enabled:
+            return None, "DISABLED"
+        read, _ = self.policy(headers)
+        if not read:
+            return None, "BYPASS"
+        body = await self.get(key)
+        return body, "HIT" if body is not None else "MISS"
+
+    async def store(self, headers: Mapping[str, str], key: str, body: Dict[str, Any]):
+        if self.enabled and self.policy(headers)[1]:
+            await self.put(key, body)
+
+    def close(self):
+        if self.disk is not None:
+            self.disk.close()
+
+
+response_cache = ResponseCache()
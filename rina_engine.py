@@ -0,0 +1,221 @@
+import asyncio
+import heapq
+import itertools
+import math
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Dict, List, Optional, TypeVar
+
+from rina_metrics import QUEUE_SHED
+from rina_provider_router import ollama_pool
+from rina_telemetry import queue_wait
+
+T = TypeVar("T")
+
+# Configuration
+MAX_CONCURRENCY_PER_MODEL = int(os.getenv("RINA_MAX_CONCURRENCY_PER_MODEL", "4"))
+MAX_QUEUE_DEPTH = int(os.getenv("RINA_MAX_QUEUE_DEPTH", "32"))
+QUEUE_TIMEOUT = float(os.getenv("RINA_QUEUE_TIMEOUT", "30"))
+REQUEST_TIMEOUT = float(os.getenv("RINA_REQUEST_TIMEOUT", "120"))
+DISCONNECT_POLL_INTERVAL = 0.25
+
+
+class Saturated(Exception):
+    """Raised when a model lane cannot take more work.
+
+    ``status_code`` is 429 when the wait queue is full (or the request was
+    shed for a higher-priority one) and 503 when the request queued for
+    longer than ``QUEUE_TIMEOUT``.
+    """
+
+    def __init__(self, model: str, status_code: int, retry_after: int):
+        super().__init__(f"Model {model} is saturated")
+        self.model = model
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class ClientDisconnected(Exception):
+    """Raised when the HTTP client hangs up before the result is ready."""
+
+
+class _Waiter:
+    __slots__ = ("priority", "seq", "future")
+
+    def __init__(self, priority: int, seq: int):
+        self.priority = priority
+        self.seq = seq
+        self.future = asyncio.get_running_loop().create_future()
+
+    def __lt__(self, other: "_Waiter") -> bool:
+        # Heap order: highest priority first, FIFO within a priority.
+        return (-self.priority, self.seq) < (-other.priority, other.seq)
+
+
+class _Lane:
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.active = 0
+        self.waiters: List[_Waiter] = []
+        self.service_time = 1.0  # EWMA of seconds a slot is held
+
+    @property
+    def waiting(self) -> int:
+        return len(self.waiters)
+
+    def grant(self):
+        """Hand free slots to the best waiters still waiting."""
+        while self.waiters and self.active < self.limit:
+            waiter = heapq.heappop(self.waiters)
+            if not waiter.future.done():
+                self.active += 1
+                waiter.future.set_result(None)
+
+    def remove(self, waiter: _Waiter):
+        if waiter in self.waiters:
+            self.waiters.remove(waiter)
+            heapq.heapify(self.waiters)
+
+
+class Lease:
+    """A held concurrency slot; ``release`` is idempotent."""
+
+    def __init__(self, lane: _Lane):
+        self._lane = lane
+        self._started = time.monotonic()
+        self._released = False
+
+    def release(self):
+        if self._released:
+            return
+        self._released = True
+        lane = self._lane
+        lane.active -= 1
+        lane.service_time = 0.8 * lane.service_time + 0.2 * (time.monotonic() - self._started)
+        lane.grant()
+
+
+class ModelLimiter:
+    """Bounded per-model concurrency with a bounded, priority-ordered wait queue.
+
+    Waiters are served highest ``priority`` first. When the queue is full a
+    newcomer displaces (sheds, with 429) the newest waiter of a lower
+    priority, so low tiers are shed before high ones under load.
+
+    ``max_concurrency`` is per backend: a lane admits that many times
+    ``capacity(model)``, the number of backends currently able to serve
+    the model, so adding Ollama hosts raises throughput.
+    """
+
+    def __init__(self, max_concurrency: int = MAX_CONCURRENCY_PER_MODEL,
+                 max_queue: int = MAX_QUEUE_DEPTH, queue_timeout: float = QUEUE_TIMEOUT,
+                 capacity: Callable[[str], int] = lambda model: 1):
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self.capacity = capacity
+        self._lanes: Dict[str, _Lane] = {}
+        self._seq = itertools.count()
+
+    def _lane(self, model: str) -> _Lane:
+        lane = self._lanes.get(model)
+        if lane is None:
+            lane = self._lanes[model] = _Lane(self.max_concurrency)
+        # Backends come and go (ejection, health checks), so resize on every use.
+        limit = self.max_concurrency * max(1, self.capacity(model))
+        if limit != lane.limit:
+            lane.limit = limit
+            lane.grant()
+        return lane
+
+    def retry_after(self, model: str) -> int:
+        lane = self._lane(model)
+        backlog = (lane.waiting + 1) / lane.limit
+        return max(1, math.ceil(backlog * lane.service_time))
+
+    async def acquire(self, model: str, priority: int = 0) -> Lease:
+        lane = self._lane(model)
+        if lane.active < lane.limit and not lane.waiters:
+            lane.active += 1
+            queue_wait.set(0.0)
+            return Lease(lane)
+        if lane.waiting >= self.max_queue:
+            victim = max(lane.waiters, default=None)
+            if victim is None or victim.priority >= priority:
+                raise Saturated(model, 429, self.retry_after(model))
+            lane.remove(victim)
+            victim.future.set_exception(Saturated(model, 429, self.retry_after(model)))
+            QUEUE_SHED.labels(model).inc()
+
+        waiter = _Waiter(priority, next(self._seq))
+        heapq.heappush(lane.waiters, waiter)
+        queued = time.monotonic()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), self.queue_timeout)
+        except asyncio.TimeoutError:
+            if not self._granted(waiter):
+                lane.remove(waiter)
+                waiter.future.cancel()
+                raise Saturated(model, 503, self.retry_after(model)) from None
+        except asyncio.CancelledError:
+            if self._granted(waiter):
+                # The slot was handed over as we were cancelled; pass it on.
+                lane.active -= 1
+                lane.grant()
+            else:
+                lane.remove(waiter)
+                waiter.future.cancel()
+            raise
+        queue_wait.set(time.monotonic() - queued)
+        return Lease(lane)
+
+    @staticmethod
+    def _granted(waiter: _Waiter) -> bool:
+        future = waiter.future
+        return future.done() and not future.cancelled() and future.exception() is None
+
+    @asynccontextmanager
+    async def slot(self, model: str, priority: int = 0):
+        lease = await self.acquire(model, priority)
+        try:
+            yield lease
+        finally:
+            lease.release()
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        return {
+            model: {"active": lane.active, "waiting": lane.waiting, "limit": lane.limit}
+            for model, lane in self._lanes.items()
+        }
+
+
+model_limiter = ModelLimiter(capacity=ollama_pool.capacity)
+
+
+async def run_until_disconnect(request, awaitable: Awaitable[T],
+                               timeout: Optional[float] = REQUEST_TIMEOUT) -> T:
+    """Await ``awaitable`` but cancel it if the HTTP client goes away.
+
+    Cancellation propagates into the upstream call, so the model server
+    stops generating for a client that is no longer listening. Raises
+    ``asyncio.TimeoutError`` after ``timeout`` seconds and
+    ``ClientDisconnected`` when the client hangs up.
+    """
+    task = asyncio.ensure_future(awaitable)
+    deadline = None if timeout is None else time.monotonic() + timeout
+    try:
+        while True:
+            wait = DISCONNECT_POLL_INTERVAL
+            if deadline is not None:
+                wait = min(wait, max(0.0, deadline - time.monotonic()))
+            done, _ = await asyncio.wait({task}, timeout=wait)
+            if done:
+                return task.result()
+            if deadline is not None and time.monotonic() >= deadline:
+                raise asyncio.TimeoutError()
+            if await request.is_disconnected():
+                raise ClientDisconnected()
+    finally:
+        if not task.done():
+            task.cancel()
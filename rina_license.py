@@ -0,0 +1,131 @@
+import base64
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import padding, rsa
+
+logger = logging.getLogger("rina.license")
+
+# Configuration
+LICENSE_PUBLIC_KEY_PATH = os.getenv("LICENSE_PUBLIC_KEY_PATH")
+LICENSE_ISSUER = os.getenv("LICENSE_ISSUER")
+LICENSE_CACHE_SIZE = int(os.getenv("RINA_LICENSE_CACHE_SIZE", "10000"))
+LICENSE_LEEWAY = float(os.getenv("RINA_LICENSE_LEEWAY", "30"))
+INVALID_LICENSE_TTL = float(os.getenv("RINA_INVALID_LICENSE_TTL", "60"))
+
+# Matches the RS256 tokens minted by routes/license.js.
+_ALGORITHMS = {
+    "RS256": hashes.SHA256,
+    "RS384": hashes.SHA384,
+    "RS512": hashes.SHA512,
+}
+
+
+class License:
+    __slots__ = ("subject", "tier", "expires_at", "claims")
+
+    def __init__(self, claims: Dict[str, Any]):
+        self.claims = claims
+        self.subject = claims.get("sub")
+        self.tier = claims.get("tier")
+        self.expires_at = float(claims["exp"])
+
+    def expired(self, now: Optional[float] = None) -> bool:
+        return (time.time() if now is None else now) >= self.expires_at
+
+
+def _b64url(segment: str) -> bytes:
+    return base64.urlsafe_b64decode(segment + "=" * (-len(segment) % 4))
+
+
+class LicenseVerifier:
+    """Verify signed license tokens, caching the outcome per token.
+
+    Tokens are RS256 JWTs. The public key is loaded once. Verified tokens
+    are cached (LRU, keyed by token hash) until their ``exp``; rejected
+    ones for ``INVALID_LICENSE_TTL`` seconds, so repeated calls cost a
+    dict lookup either way.
+    """
+
+    def __init__(self, public_key_path: Optional[str] = LICENSE_PUBLIC_KEY_PATH,
+                 max_entries: int = LICENSE_CACHE_SIZE):
+        self.public_key_path = public_key_path
+        self.max_entries = max(1, max_entries)
+        self._public_key: Optional[rsa.RSAPublicKey] = None
+        self._key_loaded = False
+        self._cache: "OrderedDict[bytes, Tuple[Optional[License], float]]" = OrderedDict()
+
+    def _key(self) -> Optional[rsa.RSAPublicKey]:
+        if not self._key_loaded:
+            self._key_loaded = True
+            if not self.public_key_path:
+                logger.error("LICENSE_PUBLIC_KEY_PATH is not set; every license will be rejected")
+            else:
+                try:
+                    with open(self.public_key_path, "rb") as f:
+                        key = serialization.load_pem_public_key(f.read())
+                    if not isinstance(key, rsa.RSAPublicKey):
+                        raise ValueError("expected an RSA public key")
+                    self._public_key = key
+                except (OSError, ValueError) as exc:
+                    logger.error(f"Loading license public key failed: {exc}")
+        return self._public_key
+
+    def verify(self, token: str) -> Optional[License]:
+        """Return the token's ``License`` if it is validly signed and current, else ``None``."""
+        if not token:
+            return None
+        now = time.time()
+        digest = hashlib.sha256(token.encode("utf-8")).digest()
+        entry = self._cache.get(digest)
+        if entry is not None:
+            license, until = entry
+            if now < until:
+                self._cache.move_to_end(digest)
+                return license
+            del self._cache[digest]
+
+        license = self._check(token, now)
+        until = license.expires_at if license is not None else now + INVALID_LICENSE_TTL
+        self._cache[digest] = (license, until)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+        return license
+
+    def _check(self, token: str, now: float) -> Optional[License]:
+        key = self._key()
+        if key is None:
+            return None
+        try:
+            header_b64, payload_b64, signature_b64 = token.split(".")
+            header = json.loads(_b64url(header_b64))
+            algorithm = _ALGORITHMS.get(header.get("alg"))
+            if algorithm is None:
+                return None
+            key.verify(
+                _b64url(signature_b64),
+                f"{header_b64}.{payload_b64}".encode("ascii"),
+                padding.PKCS1v15(),
+                algorithm(),
+            )
+            claims = json.loads(_b64url(payload_b64))
+            license = License(claims)
+            if license.expired(now):
+                return None
+            if claims.get("nbf") is not None and float(claims["nbf"]) > now + LICENSE_LEEWAY:
+                return None
+        except (InvalidSignature, ValueError, KeyError, TypeError, AttributeError):
+            return None
+        if LICENSE_ISSUER and claims.get("iss") != LICENSE_ISSUER:
+            return None
+        return license
+
+
+license_verifier = LicenseVerifier()
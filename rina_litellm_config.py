@@ -1,48 +1,91 @@
 import base64
 import mimetypes
-from typing import Union
+from typing import Any, Dict, List, Union
 import asyncio
-from litellm import acompletion, completion
+from litellm import acompletion
+from rina_provider_router import ollama_pool
+from rina_telemetry import GenerationTimer
 
-OLLAMA_API = "http://localhost:11434"
+def as_messages(prompt: Union[str, List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """Accept either a bare prompt string or a full chat history."""
+    if isinstance(prompt, str):
+        return [{"role": "user", "content": prompt}]
+    return list(prompt)
 
 async def rina_ollama_stream(prompt, model="ollama/llama2"):
-    response = await acompletion(
-        model=model,
-        messages=[{"role": "user", "content": prompt}],
-        api_base=OLLAMA_API,
-        stream=True
-    )
-    async for chunk in response:
-        if "choices" in chunk:
-            delta = chunk["choices"][0]["delta"]
-            if "content" in delta:
-                yield delta["content"]
-
-async def rina_ollama_json(prompt, model="ollama/llama2"):
-    response = completion(
-        model=model,
-        messages=[{"role": "user", "content": prompt}],
-        api_base=OLLAMA_API,
-        format="json"
-    )
+    timer = GenerationTimer(model, streaming=True)
+    outcome = "error"
+    try:
+        async with ollama_pool.lease(model) as upstream:
+            response = await acompletion(
+                model=model,
+                messages=as_messages(prompt),
+                stream=True,
+                stream_options={"include_usage": True},
+                **upstream.kwargs
+            )
+            try:
+                async for chunk in response:
+                    # The usage chunk at the end has no choices.
+                    timer.usage(getattr(chunk, "usage", None))
+                    if chunk.get("choices"):
+                        delta = chunk["choices"][0]["delta"]
+                        # The final chunk carries content=None alongside finish_reason.
+                        if "content" in delta and delta["content"]:
+                            timer.token()
+                            yield delta["content"]
+                upstream.completed(timer.completion_tokens or timer.tokens)
+                outcome = "ok"
+            finally:
+                # Release the pooled connection (and stop generation) if the consumer bails early.
+                await response.aclose()
+    except (asyncio.CancelledError, GeneratorExit):
+        outcome = "cancelled"
+        raise
+    finally:
+        timer.finish(outcome)
+
+async def rina_ollama_json(prompt, model="ollama/llama2", timeout=None):
+    timer = GenerationTimer(model)
+    outcome = "error"
+    try:
+        async with ollama_pool.lease(model) as upstream:
+            response = await acompletion(
+                model=model,
+                messages=as_messages(prompt),
+                format="json",
+                timeout=timeout,
+                **upstream.kwargs
+            )
+            timer.usage(getattr(response, "usage", None))
+            upstream.completed(timer.completion_tokens)
+        outcome = "ok"
+    except asyncio.CancelledError:
+        outcome = "cancelled"
+        raise
+    finally:
+        timer.finish(outcome)
     return response
 
+def _encode_file(path: str) -> str:
+    with open(path, "rb") as f:
+        return base64.b64encode(f.read()).decode("utf-8")
+
 async def vision_chat(image_input: Union[str, bytes], text_prompt: str = "What is in this image?", model: str = "ollama/llava"):
     """
     Send an image (path, URL, or base64) + text prompt to Ollama's llava model.
     """
     if isinstance(image_input, str) and not image_input.startswith("data:"):
-        # If it's a file path, encode to base64
+        # If it's a file path, read and encode it off the event loop
         try:
-            with open(image_input, "rb") as f:
-                b64 = base64.b64encode(f.read()).decode("utf-8")
+            b64 = await asyncio.to_thread(_encode_file, image_input)
             mime = mimetypes.guess_type(image_input)[0] or "image/png"
             image_b64 = f"data:{mime};base64,{b64}"
-        except FileNotFoundError:
+        except (FileNotFoundError, OSError):
             image_b64 = image_input
     elif isinstance(image_input, bytes):
-        image_b64 = "data:image/png;base64," + base64.b64encode(image_input).decode("utf-8")
+        b64 = await asyncio.to_thread(base64.b64encode, image_input)
+        image_b64 = "data:image/png;base64," + b64.decode("utf-8")
     else:
         image_b64 = image_input
 
@@ -56,5 +99,37 @@ async def vision_chat(image_input: Union[str, bytes], text_prompt: str = "What i
         }
     ]
 
-    response = await acompletion(model=model, messages=messages, api_base=OLLAMA_API)
-    return response
\ No newline at end of file
+    timer = GenerationTimer(model)
+    outcome = "error"
+    try:
+        async with ollama_pool.lease(model) as upstream:
+            response = await acompletion(model=model, messages=messages, **upstream.kwargs)
+            timer.usage(getattr(response, "usage", None))
+            upstream.completed(timer.completion_tokens)
+        outcome = "ok"
+    except asyncio.CancelledError:
+        outcome = "cancelled"
+        raise
+    finally:
+        timer.finish(outcome)
+    return response
+
+async def rina_summarize(summary: str, turns: List[Dict[str, Any]], model="ollama/llama2", timeout=None) -> str:
+    """Fold older conversation turns into a short running summary."""
+    transcript = "\n".join(f"{t['role']}: {t['content']}" for t in turns)
+    instructions = (
+        "Update the running summary of this conversation. Keep facts, names, decisions "
+        "and open questions; drop pleasantries. Reply with the summary only."
+    )
+    async with ollama_pool.lease(model) as upstream:
+        response = await acompletion(
+            model=model,
+            messages=[
+                {"role": "system", "content": instructions},
+                {"role": "user", "content": f"Current summary:\n{summary or '(none)'}\n\nNew turns:\n{transcript}"},
+            ],
+            timeout=timeout,
+            **upstream.kwargs
+        )
+        upstream.completed(getattr(getattr(response, "usage", None), "completion_tokens", None))
+    return response.choices[0].message.content or summary
\ No newline at end of file
@@ -0,0 +1,120 @@
+from prometheus_client import Counter, Gauge, Histogram
+
+# Metrics live in the default registry, which the Instrumentator exposes on /metrics.
+
+# Upstream transport
+UPSTREAM_REQUESTS = Counter(
+    "rina_upstream_requests_total",
+    "Requests sent to an upstream model server",
+    ["upstream"],
+)
+UPSTREAM_POOL_HITS = Counter(
+    "rina_upstream_pool_hits_total",
+    "Upstream requests served on an already-open pooled connection",
+    ["upstream"],
+)
+UPSTREAM_CONNECTIONS_OPENED = Counter(
+    "rina_upstream_connections_opened_total",
+    "New TCP connections opened to an upstream",
+    ["upstream"],
+)
+UPSTREAM_IN_FLIGHT = Gauge(
+    "rina_upstream_in_flight",
+    "Upstream requests whose response body has not been fully read yet",
+    ["upstream"],
+)
+UPSTREAM_ERRORS = Counter(
+    "rina_upstream_errors_total",
+    "Transport-level errors talking to an upstream",
+    ["upstream"],
+)
+
+# Response cache
+CACHE_HITS = Counter(
+    "rina_cache_hits_total",
+    "Completion cache hits",
+    ["tier"],
+)
+CACHE_MISSES = Counter(
+    "rina_cache_misses_total",
+    "Completion cache lookups that found nothing",
+)
+CACHE_EVICTIONS = Counter(
+    "rina_cache_evictions_total",
+    "Completion cache entries dropped for size or expiry",
+    ["tier"],
+)
+CACHE_BYTES = Gauge(
+    "rina_cache_bytes",
+    "Bytes held by the completion cache",
+    ["tier"],
+)
+
+# Request coalescing
+COALESCED_REQUESTS = Counter(
+    "rina_coalesced_requests_total",
+    "Requests that attached to an identical in-flight upstream generation",
+    ["kind"],
+)
+
+# Quotas and load shedding
+QUOTA_REJECTIONS = Counter(
+    "rina_quota_rejections_total",
+    "Requests rejected by per-principal rate limits",
+    ["tier", "bucket"],
+)
+QUOTA_TOKENS = Counter(
+    "rina_quota_tokens_total",
+    "Generated tokens charged against principal quotas",
+    ["tier"],
+)
+QUEUE_SHED = Counter(
+    "rina_queue_shed_total",
+    "Queued requests displaced by higher-priority work",
+    ["model"],
+)
+
+# Generation latency (labelled by route, provider and model)
+_GENERATION_LABELS = ["route", "provider", "model"]
+_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+GENERATIONS = Counter(
+    "rina_generations_total",
+    "Upstream generations by outcome (ok, error, cancelled)",
+    _GENERATION_LABELS + ["outcome"],
+)
+GENERATION_QUEUE_WAIT = Histogram(
+    "rina_generation_queue_wait_seconds",
+    "Time spent waiting for a model slot before generating",
+    _GENERATION_LABELS,
+    buckets=_LATENCY_BUCKETS,
+)
+GENERATION_TTFT = Histogram(
+    "rina_generation_ttft_seconds",
+    "Time from upstream request to first streamed token",
+    _GENERATION_LABELS,
+    buckets=_LATENCY_BUCKETS,
+)
+GENERATION_INTER_TOKEN = Histogram(
+    "rina_generation_inter_token_seconds",
+    "Gap between consecutive streamed tokens",
+    _GENERATION_LABELS,
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+GENERATION_DURATION = Histogram(
+    "rina_generation_duration_seconds",
+    "Total upstream generation time",
+    _GENERATION_LABELS,
+    buckets=_LATENCY_BUCKETS,
+)
+GENERATION_TOKENS_PER_SECOND = Histogram(
+    "rina_generation_tokens_per_second",
+    "Completion tokens per second of generation",
+    _GENERATION_LABELS,
+    buckets=(1, 2.5, 5, 10, 20, 40, 80, 160, 320, 640),
+)
+GENERATION_TOKENS = Counter(
+    "rina_generation_tokens_total",
+    "Prompt and completion tokens processed upstream",
+    _GENERATION_LABELS + ["kind"],
+)
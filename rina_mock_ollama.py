@@ -0,0 +1,159 @@
+"""Mock Ollama / OpenAI-compatible model server for offline benchmarking.
+
+Serves ``/api/chat``, ``/api/generate``, ``/api/tags`` and ``/api/show``
+(Ollama) plus ``/v1/chat/completions`` and ``/v1/models`` (OpenAI), with
+configurable time to first token, token rate, reply length and failure
+rate. No model, GPU or network access is needed::
+
+    python rina_mock_ollama.py --port 11434 --latency 0.05 --token-rate 50
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from typing import Any, AsyncIterator, Dict
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+MODELS = ("llama2", "llava", "mistral", "gpt-4-turbo")
+
+
+class MockSettings:
+    def __init__(self, latency: float = 0.05, token_rate: float = 50.0, tokens: int = 32,
+                 failure_rate: float = 0.0, seed: int = 0):
+        self.latency = latency  # seconds before the first token (prefill)
+        self.token_rate = token_rate  # tokens per second after the first
+        self.tokens = tokens  # completion length
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+
+    def fails(self) -> bool:
+        return self.failure_rate > 0 and self.random.random() < self.failure_rate
+
+    def prompt_tokens(self, messages: Any) -> int:
+        return max(1, len(json.dumps(messages)) // 4)
+
+    async def tokens_out(self) -> AsyncIterator[str]:
+        await asyncio.sleep(self.latency)
+        gap = 1.0 / self.token_rate if self.token_rate > 0 else 0.0
+        for i in range(self.tokens):
+            if i:
+                await asyncio.sleep(gap)
+            yield f"tok{i} "
+
+    async def full_reply(self, json_format: bool) -> str:
+        text = "".join([t async for t in self.tokens_out()])
+        return json.dumps({"answer": text.strip()}) if json_format else text
+
+
+def create_mock_app(settings: MockSettings) -> FastAPI:
+    app = FastAPI(title="Rina mock model server")
+
+    @app.get("/api/tags")
+    async def tags():
+        return {"models": [{"name": f"{m}:latest", "model": f"{m}:latest"} for m in MODELS]}
+
+    @app.post("/api/show")
+    async def show():
+        return {"modelfile": "", "parameters": "", "template": "", "details": {}, "model_info": {},
+                "capabilities": ["completion", "vision"]}
+
+    async def ollama(request: Request, key: str):
+        body = await request.json()
+        if settings.fails():
+            return JSONResponse({"error": "mock failure"}, status_code=500)
+        model = body.get("model")
+        prompt_tokens = settings.prompt_tokens(body.get("messages") or body.get("prompt"))
+
+        def frame(text: str, done: bool) -> Dict[str, Any]:
+            out = {"model": model, "created_at": "2024-01-01T00:00:00Z", "done": done}
+            out[key] = {"role": "assistant", "content": text} if key == "message" else text
+            if done:
+                out.update(done_reason="stop", prompt_eval_count=prompt_tokens, eval_count=settings.tokens)
+            return out
+
+        if not body.get("stream", True):
+            return frame(await settings.full_reply(body.get("format") == "json"), True)
+
+        async def stream():
+            async for token in settings.tokens_out():
+                yield json.dumps(frame(token, False)) + "\n"
+            yield json.dumps(frame("", True)) + "\n"
+
+        return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+    @app.post("/api/chat")
+    async def ollama_chat(request: Request):
+        return await ollama(request, "message")
+
+    @app.post("/api/generate")
+    async def ollama_generate(request: Request):
+        return await ollama(request, "response")
+
+    @app.get("/v1/models")
+    async def openai_models():
+        return {"object": "list", "data": [{"id": m, "object": "model"} for m in MODELS]}
+
+    @app.post("/v1/chat/completions")
+    async def openai_chat(request: Request):
+        body = await request.json()
+        if settings.fails():
+            return JSONResponse({"error": {"message": "mock failure", "type": "server_error"}}, status_code=500)
+        model = body.get("model")
+        rid = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+        usage = {"prompt_tokens": settings.prompt_tokens(body.get("messages")),
+                 "completion_tokens": settings.tokens}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+
+        if not body.get("stream"):
+            json_format = (body.get("response_format") or {}).get("type") == "json_object"
+            return {
+                "id": rid, "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": await settings.full_reply(json_format)}}],
+                "usage": usage,
+            }
+
+        def chunk(delta: Dict[str, Any], finish_reason=None) -> str:
+            data = {"id": rid, "object": "chat.completion.chunk", "created": created, "model": model,
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+            return f"data: {json.dumps(data)}\n\n"
+
+        async def stream():
+            async for token in settings.tokens_out():
+                yield chunk({"role": "assistant", "content": token})
+            yield chunk({}, "stop")
+            if (body.get("stream_options") or {}).get("include_usage"):
+                data = {"id": rid, "object": "chat.completion.chunk", "created": created, "model": model,
+                        "choices": [], "usage": usage}
+                yield f"data: {json.dumps(data)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds to first token")
+    parser.add_argument("--token-rate", type=float, default=50.0, help="tokens per second")
+    parser.add_argument("--tokens", type=int, default=32, help="tokens per reply")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="fraction of requests answered with 500")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    import uvicorn
+
+    settings = MockSettings(args.latency, args.token_rate, args.tokens, args.failure_rate, args.seed)
+    uvicorn.run(create_mock_app(settings), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
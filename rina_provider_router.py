@@ -1,4 +1,24 @@
+import asyncio
+import logging
 import os
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional, Set
+
+import httpx
+import litellm
+
+from rina_transport import transports
+
+logger = logging.getLogger("rina.router")
+
+DEFAULT_OLLAMA_API = "http://localhost:11434"
+BALANCING_POLICY = os.getenv("RINA_OLLAMA_POLICY", "least_outstanding")  # or "ewma"
+EJECT_AFTER_FAILURES = int(os.getenv("RINA_OLLAMA_EJECT_AFTER", "3"))
+EJECT_SECONDS = float(os.getenv("RINA_OLLAMA_EJECT_SECONDS", "30"))
+HEALTH_INTERVAL = float(os.getenv("RINA_OLLAMA_HEALTH_INTERVAL", "10"))
+HEALTH_TIMEOUT = float(os.getenv("RINA_OLLAMA_HEALTH_TIMEOUT", "3"))
+
 
 def get_model(provider="local"):
     if provider == "local":
@@ -10,4 +30,229 @@ def get_model(provider="local"):
     elif provider == "groq":
         return "mixtral-8x7b"
     else:
-        return "ollama/mistral"
\ No newline at end of file
+        return "ollama/mistral"
+
+
+def get_vision_model(provider="local"):
+    if provider == "local":
+        return "ollama/llava"
+    return get_model(provider)
+
+
+def is_backend_failure(error: BaseException) -> bool:
+    """Whether ``error`` says something about the backend rather than the request.
+
+    litellm raises ``APIConnectionError`` for client-side mistakes too (a
+    malformed message, say), so look down the ``__cause__`` chain for the
+    transport error, timeout or 5xx response underneath.
+    """
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        if isinstance(error, (httpx.TransportError, litellm.Timeout, asyncio.TimeoutError)):
+            return True
+        if isinstance(error, httpx.HTTPStatusError):
+            return error.response.status_code >= 500
+        error = error.__cause__ or error.__context__
+    return False
+
+
+class NoBackendAvailable(Exception):
+    """Raised when no Ollama backend can serve the requested model."""
+
+
+def is_ollama_model(model: str) -> bool:
+    return model.startswith(("ollama/", "ollama_chat/"))
+
+
+def _model_tag(model: str) -> str:
+    name = model.split("/", 1)[-1]
+    return name if ":" in name else f"{name}:latest"
+
+
+class Backend:
+    def __init__(self, url: str, models: Optional[List[str]] = None):
+        self.url = url.rstrip("/")
+        self.static_models: Set[str] = {_model_tag(m) for m in models or []}
+        self.models: Set[str] = set(self.static_models)
+        self.outstanding = 0
+        self.latency_ewma: Optional[float] = None  # seconds per generated token
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+        self.healthy = True
+        self.last_error: Optional[str] = None
+        self.last_checked: Optional[float] = None
+
+    @property
+    def ejected(self) -> bool:
+        return time.monotonic() < self.ejected_until
+
+    @property
+    def available(self) -> bool:
+        return self.healthy and not self.ejected
+
+    def serves(self, model: str) -> bool:
+        # An empty inventory means we have not probed yet; assume it can serve.
+        return not self.models or _model_tag(model) in self.models
+
+    def score(self) -> float:
+        latency = self.latency_ewma or 0.0
+        if BALANCING_POLICY == "ewma":
+            # Expected wait: everyone ahead of us plus ourselves, at the observed latency.
+            return (self.outstanding + 1) * (latency or 1.0)
+        return self.outstanding + latency / 1000.0
+
+    def record_success(self, latency: Optional[float] = None):
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+        self.last_error = None
+        if latency is not None:
+            self.latency_ewma = latency if self.latency_ewma is None else 0.7 * self.latency_ewma + 0.3 * latency
+
+    def record_failure(self, error: BaseException):
+        self.consecutive_failures += 1
+        self.last_error = f"{type(error).__name__}: {error}"
+        if self.consecutive_failures >= EJECT_AFTER_FAILURES:
+            self.ejected_until = time.monotonic() + EJECT_SECONDS
+            logger.warning("Ejecting Ollama backend %s for %ss: %s", self.url, EJECT_SECONDS, self.last_error)
+
+    def snapshot(self) -> Dict:
+        return {
+            "url": self.url,
+            "status": "running" if self.available else ("ejected" if self.ejected else "down"),
+            "models": sorted(self.models),
+            "outstanding": self.outstanding,
+            "latency_per_token_ms": None if self.latency_ewma is None else round(self.latency_ewma * 1000, 2),
+            "consecutive_failures": self.consecutive_failures,
+            "last_error": self.last_error,
+            "last_checked": self.last_checked,
+        }
+
+
+class BackendLease:
+    """Routing decision for one upstream call; pass ``kwargs`` to litellm.
+
+    Report the generated token count with ``completed``: backends are
+    scored on seconds per generated token, which is comparable between
+    streamed and JSON calls of any length.
+    """
+
+    def __init__(self, backend: Optional[Backend]):
+        self.backend = backend
+        self.started = time.monotonic()
+        self.tokens: Optional[int] = None
+
+    @property
+    def kwargs(self) -> Dict:
+        if self.backend is None:
+            return {}
+        return {"api_base": self.backend.url, "client": transports.ollama(self.backend.url).handler}
+
+    def completed(self, tokens: Optional[int]):
+        self.tokens = tokens
+
+    def latency(self) -> Optional[float]:
+        if not self.tokens:
+            return None
+        return (time.monotonic() - self.started) / self.tokens
+
+
+def _parse_backends(spec: str) -> List[Backend]:
+    """Parse ``url[=model|model],url...`` as used by RINA_OLLAMA_BACKENDS."""
+    backends = []
+    for entry in spec.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        url, _, models = entry.partition("=")
+        backends.append(Backend(url, [m for m in models.split("|") if m]))
+    return backends
+
+
+class BackendPool:
+    def __init__(self, backends: List[Backend]):
+        self.backends = backends
+        self._health_task: Optional[asyncio.Task] = None
+
+    def capacity(self, model: str) -> int:
+        """Number of backends that can take ``model`` right now (1 for cloud models)."""
+        if not is_ollama_model(model):
+            return 1
+        return sum(1 for b in self.backends if b.available and b.serves(model)) or 1
+
+    def select(self, model: str) -> Backend:
+        serving = [b for b in self.backends if b.serves(model)]
+        candidates = [b for b in serving if b.available] or serving
+        if not candidates:
+            raise NoBackendAvailable(f"No Ollama backend serves {model}")
+        return min(candidates, key=Backend.score)
+
+    @asynccontextmanager
+    async def lease(self, model: str):
+        """Pick a backend for ``model`` and track the call's outcome.
+
+        Cloud models get an empty lease so callers can treat every
+        provider the same way.
+        """
+        if not is_ollama_model(model):
+            yield BackendLease(None)
+            return
+        backend = self.select(model)
+        lease = BackendLease(backend)
+        backend.outstanding += 1
+        try:
+            yield lease
+        except Exception as exc:
+            if is_backend_failure(exc):
+                backend.record_failure(exc)
+            raise
+        else:
+            backend.record_success(lease.latency())
+        finally:
+            backend.outstanding -= 1
+
+    async def probe(self, backend: Backend):
+        client = transports.ollama(backend.url).client
+        backend.last_checked = time.time()
+        try:
+            response = await client.get(f"{backend.url}/api/tags", timeout=HEALTH_TIMEOUT)
+            response.raise_for_status()
+            tags = {m["name"] for m in response.json().get("models", [])}
+        except (httpx.HTTPError, ValueError, KeyError) as exc:
+            backend.healthy = False
+            backend.last_error = f"{type(exc).__name__}: {exc}"
+            return
+        # Passive ejection is left alone: /api/tags can answer while generation
+        # fails, so only expiry or a successful request puts the backend back.
+        backend.models = tags | backend.static_models
+        backend.healthy = True
+
+    async def probe_all(self):
+        await asyncio.gather(*(self.probe(b) for b in self.backends))
+
+    async def _health_loop(self):
+        while True:
+            try:
+                await self.probe_all()
+            except Exception as exc:
+                logger.error(f"Ollama health probe failed: {exc}")
+            await asyncio.sleep(HEALTH_INTERVAL)
+
+    async def start(self):
+        if self._health_task is None and HEALTH_INTERVAL > 0:
+            self._health_task = asyncio.create_task(self._health_loop())
+
+    async def stop(self):
+        if self._health_task is not None:
+            self._health_task.cancel()
+            try:
+                await self._health_task
+            except asyncio.CancelledError:
+                pass
+            self._health_task = None
+
+    def snapshot(self) -> List[Dict]:
+        return [b.snapshot() for b in self.backends]
+
+
+ollama_pool = BackendPool(_parse_backends(os.getenv("RINA_OLLAMA_BACKENDS", DEFAULT_OLLAMA_API)))
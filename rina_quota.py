@@ -0,0 +1,258 @@
+import hashlib
+import json
+import logging
+import os
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import AsyncIterator, Callable, Dict, Optional, Tuple
+
+from rina_license import License
+from rina_metrics import QUOTA_REJECTIONS, QUOTA_TOKENS
+
+logger = logging.getLogger("rina.quota")
+
+# Configuration
+QUOTA_ENABLED = os.getenv("RINA_QUOTA_ENABLED", "false").lower() == "true"
+DEFAULT_TIER = os.getenv("RINA_QUOTA_DEFAULT_TIER", "community")
+QUOTA_MAX_KEYS = int(os.getenv("RINA_QUOTA_MAX_KEYS", "100000"))
+QUOTA_FLUSH_TOKENS = int(os.getenv("RINA_QUOTA_FLUSH_TOKENS", "16"))
+QUOTA_REDIS_URL = os.getenv("RINA_QUOTA_REDIS_URL")
+
+# requests/min, generated tokens/min (0 = unlimited) and queue priority per tier.
+# The tier names are the ones routes/license.js puts in license tokens.
+_DEFAULT_TIERS = {
+    "community": {"rpm": 30, "tpm": 20000, "priority": 0},
+    "starter": {"rpm": 60, "tpm": 60000, "priority": 1},
+    "personal": {"rpm": 60, "tpm": 60000, "priority": 1},
+    "pro": {"rpm": 120, "tpm": 200000, "priority": 2},
+    "enterprise": {"rpm": 600, "tpm": 1000000, "priority": 3},
+    "admin": {"rpm": 0, "tpm": 0, "priority": 4},
+}
+
+REQUESTS = "requests"
+TOKENS = "tokens"
+
+
+class Tier:
+    __slots__ = ("name", "requests_per_minute", "tokens_per_minute", "priority")
+
+    def __init__(self, name: str, rpm: float = 0, tpm: float = 0, priority: int = 0):
+        self.name = name
+        self.requests_per_minute = float(rpm)
+        self.tokens_per_minute = float(tpm)
+        self.priority = int(priority)
+
+
+def load_tiers() -> Dict[str, Tier]:
+    """Built-in tiers, overridden or extended by ``RINA_QUOTA_TIERS`` (JSON)."""
+    specs = {name: dict(spec) for name, spec in _DEFAULT_TIERS.items()}
+    raw = os.getenv("RINA_QUOTA_TIERS")
+    if raw:
+        try:
+            for name, spec in json.loads(raw).items():
+                specs.setdefault(name, {}).update(spec)
+        except (ValueError, AttributeError) as exc:
+            logger.error(f"Ignoring invalid RINA_QUOTA_TIERS: {exc}")
+    return {name: Tier(name, **spec) for name, spec in specs.items()}
+
+
+class QuotaExceeded(Exception):
+    """Raised when a principal is out of requests or tokens."""
+
+    status_code = 429
+
+    def __init__(self, principal: "Principal", bucket: str, retry_after: int):
+        super().__init__(f"Rate limit exceeded ({bucket}) for tier {principal.tier.name}")
+        self.principal = principal
+        self.bucket = bucket
+        self.retry_after = retry_after
+
+
+class Principal:
+    """Who a request is charged to: a license holder, the admin key or a client address."""
+
+    __slots__ = ("key", "tier")
+
+    def __init__(self, key: str, tier: Tier):
+        self.key = key
+        self.tier = tier
+
+    @property
+    def priority(self) -> int:
+        return self.tier.priority
+
+
+class QuotaStore(ABC):
+    """Token-bucket storage. Subclass to share quota state between workers."""
+
+    @abstractmethod
+    async def take(self, key: str, capacity: float, rate: float, amount: float,
+                   minimum: float) -> Tuple[bool, float]:
+        """Refill the bucket, then subtract ``amount`` if it holds at least ``minimum``.
+
+        Returns ``(allowed, retry_after_seconds)``. Balances may go negative
+        (down to ``-capacity``) when charging tokens after the fact.
+        """
+
+    async def close(self):
+        pass
+
+
+class MemoryQuotaStore(QuotaStore):
+    """Per-process buckets, LRU-bounded. ``clock`` is injectable for tests."""
+
+    def __init__(self, max_keys: int = QUOTA_MAX_KEYS, clock: Callable[[], float] = time.monotonic):
+        self.max_keys = max(1, max_keys)
+        self.clock = clock
+        self._buckets: "OrderedDict[str, list]" = OrderedDict()
+
+    async def take(self, key: str, capacity: float, rate: float, amount: float,
+                   minimum: float) -> Tuple[bool, float]:
+        now = self.clock()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [capacity, now]
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+        level = min(capacity, bucket[0] + (now - bucket[1]) * rate)
+        bucket[1] = now
+        if level < minimum:
+            bucket[0] = level
+            return False, (minimum - level) / rate
+        bucket[0] = max(-capacity, level - amount)
+        return True, 0.0
+
+
+_REDIS_TAKE = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local amount = tonumber(ARGV[3])
+local minimum = tonumber(ARGV[4])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'level', 'ts')
+local level = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+level = math.min(capacity, level + math.max(0, now - ts) * rate)
+local allowed = 0
+if level >= minimum then
+    level = math.max(-capacity, level - amount)
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'level', tostring(level), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(2 * capacity / rate) + 60)
+return {allowed, tostring(level)}
+"""
+
+
+class RedisQuotaStore(QuotaStore):
+    """Buckets shared by every worker through Redis (requires the ``redis`` package)."""
+
+    def __init__(self, url: str, prefix: str = "rina:quota:"):
+        import redis.asyncio as redis
+
+        self.prefix = prefix
+        self._redis = redis.from_url(url)
+        self._take = self._redis.register_script(_REDIS_TAKE)
+
+    async def take(self, key: str, capacity: float, rate: float, amount: float,
+                   minimum: float) -> Tuple[bool, float]:
+        allowed, level = await self._take(keys=[self.prefix + key], args=[capacity, rate, amount, minimum])
+        if int(allowed):
+            return True, 0.0
+        return False, (minimum - float(level)) / rate
+
+    async def close(self):
+        await self._redis.aclose()
+
+
+def _default_store() -> QuotaStore:
+    if QUOTA_REDIS_URL:
+        try:
+            return RedisQuotaStore(QUOTA_REDIS_URL)
+        except ImportError:
+            logger.error("RINA_QUOTA_REDIS_URL is set but redis is not installed; using in-memory quotas")
+    return MemoryQuotaStore()
+
+
+class QuotaManager:
+    """Per-principal token buckets for requests and for generated tokens.
+
+    ``admit`` charges one request and requires a positive token balance;
+    generated tokens are charged afterwards (``charge``) or as they stream
+    (``metered``), so a long stream uses up the balance for the requests
+    that follow it.
+    """
+
+    def __init__(self, store: Optional[QuotaStore] = None, tiers: Optional[Dict[str, Tier]] = None,
+                 enabled: bool = QUOTA_ENABLED):
+        self.store = store or _default_store()
+        self.tiers = tiers or load_tiers()
+        self.enabled = enabled
+
+    def tier(self, name: Optional[str]) -> Tier:
+        return self.tiers.get(name or DEFAULT_TIER) or self.tiers[DEFAULT_TIER]
+
+    def principal(self, license: Optional[License] = None, admin: bool = False,
+                  client: Optional[str] = None) -> Principal:
+        if admin:
+            return Principal("admin", self.tier("admin"))
+        if license is not None:
+            subject = license.subject or hashlib.sha256(json.dumps(license.claims, sort_keys=True).encode()).hexdigest()
+            return Principal(f"license:{subject}", self.tier(license.tier))
+        return Principal(f"client:{client or 'unknown'}", self.tier(None))
+
+    async def _take(self, principal: Principal, bucket: str, per_minute: float, amount: float,
+                    minimum: float) -> Tuple[bool, float]:
+        return await self.store.take(f"{principal.key}:{bucket}", per_minute, per_minute / 60.0, amount, minimum)
+
+    async def admit(self, principal: Principal):
+        """Charge one request; raise ``QuotaExceeded`` if either bucket is empty."""
+        if not self.enabled:
+            return
+        tier = principal.tier
+        if tier.tokens_per_minute:
+            allowed, wait = await self._take(principal, TOKENS, tier.tokens_per_minute, 0, 1)
+            if not allowed:
+                self._reject(principal, TOKENS, wait)
+        if tier.requests_per_minute:
+            allowed, wait = await self._take(principal, REQUESTS, tier.requests_per_minute, 1, 1)
+            if not allowed:
+                self._reject(principal, REQUESTS, wait)
+
+    def _reject(self, principal: Principal, bucket: str, wait: float):
+        QUOTA_REJECTIONS.labels(principal.tier.name, bucket).inc()
+        raise QuotaExceeded(principal, bucket, max(1, int(wait + 0.999)))
+
+    async def charge(self, principal: Principal, tokens: int):
+        """Debit generated tokens; never rejects, the next ``admit`` does."""
+        if not self.enabled or tokens <= 0:
+            return
+        QUOTA_TOKENS.labels(principal.tier.name).inc(tokens)
+        if principal.tier.tokens_per_minute:
+            # The balance floors at -capacity, so this minimum always admits the debit.
+            per_minute = principal.tier.tokens_per_minute
+            await self._take(principal, TOKENS, per_minute, tokens, -per_minute)
+
+    async def metered(self, principal: Principal, tokens: AsyncIterator[str]) -> AsyncIterator[str]:
+        """Pass a token stream through, charging it in batches of ``QUOTA_FLUSH_TOKENS``."""
+        pending = 0
+        try:
+            async for token in tokens:
+                pending += 1
+                if pending >= QUOTA_FLUSH_TOKENS:
+                    await self.charge(principal, pending)
+                    pending = 0
+                yield token
+        finally:
+            await tokens.aclose()
+            await self.charge(principal, pending)
+
+    async def close(self):
+        await self.store.close()
+
+
+quotas = QuotaManager()
@@ -0,0 +1,192 @@
+import asyncio
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from rina_engine import model_limiter
+from rina_litellm_config import rina_summarize
+
+logger = logging.getLogger("rina.sessions")
+
+# Configuration
+CONTEXT_TOKENS = int(os.getenv("RINA_CONTEXT_TOKENS", "3072"))
+SESSION_TTL = float(os.getenv("RINA_SESSION_TTL", "3600"))
+MAX_SESSIONS = int(os.getenv("RINA_MAX_SESSIONS", "10000"))
+MAX_TURNS = int(os.getenv("RINA_SESSION_MAX_TURNS", "200"))
+SUMMARIZE = os.getenv("RINA_SESSION_SUMMARIZE", "false").lower() == "true"
+SUMMARY_MODEL = os.getenv("RINA_SUMMARY_MODEL", "ollama/llama2")
+SUMMARY_TIMEOUT = float(os.getenv("RINA_SUMMARY_TIMEOUT", "60"))
+SUMMARY_PRIORITY = -1  # queued behind, and shed before, every tier's requests
+
+IMAGE_TOKENS = 256  # rough prefill cost of one image part
+
+
+def estimate_tokens(content: Any) -> int:
+    """Cheap token estimate (~4 characters per token) used for windowing."""
+    if isinstance(content, str):
+        return len(content) // 4 + 1
+    if isinstance(content, list):
+        total = 0
+        for part in content:
+            if isinstance(part, dict) and part.get("type") == "text":
+                total += estimate_tokens(part.get("text", ""))
+            else:
+                total += IMAGE_TOKENS
+        return total
+    return 1
+
+
+class Turn:
+    __slots__ = ("role", "content", "tokens")
+
+    def __init__(self, role: str, content: Any):
+        self.role = role
+        self.content = content
+        self.tokens = estimate_tokens(content) + 4  # role and framing overhead
+
+    def as_message(self) -> Dict[str, Any]:
+        return {"role": self.role, "content": self.content}
+
+
+class Session:
+    def __init__(self, session_id: str):
+        self.id = session_id
+        self.system: List[Turn] = []
+        self.turns: List[Turn] = []
+        self.summary = ""
+        self.updated = time.monotonic()
+        self._summarizing = False
+
+    def append(self, messages: List[Dict[str, Any]]):
+        turns = [Turn(m["role"], m["content"]) for m in messages]
+        system = [t for t in turns if t.role == "system"]
+        if system:
+            # Clients resend their system prompt with every request; it replaces the stored one.
+            self.system = system
+        self.turns.extend(t for t in turns if t.role != "system")
+        if len(self.turns) > MAX_TURNS:
+            del self.turns[: len(self.turns) - MAX_TURNS]
+        self.updated = time.monotonic()
+
+
+def build_window(system: List[Turn], summary: str, turns: List[Turn],
+                 budget: int = CONTEXT_TOKENS) -> Tuple[List[Dict[str, Any]], int]:
+    """Return ``(messages, dropped)`` fitting ``budget`` tokens.
+
+    System turns and the running summary lead; then the most recent
+    turns are kept newest-first until the budget runs out. System turns
+    count against the budget as well (the latest win if they alone
+    exceed it). The latest turn is always included. ``dropped`` counts
+    the older turns left out.
+    """
+    remaining = budget
+    kept_system: List[Turn] = []
+    for turn in reversed(system):
+        if turn.tokens > remaining and kept_system:
+            break
+        remaining -= turn.tokens
+        kept_system.append(turn)
+    head = [t.as_message() for t in reversed(kept_system)]
+    if summary:
+        head.append({"role": "system", "content": f"Summary of the earlier conversation:\n{summary}"})
+        remaining -= estimate_tokens(summary)
+    kept = 0
+    for turn in reversed(turns):
+        if turn.tokens > remaining and kept:
+            break
+        remaining -= turn.tokens
+        kept += 1
+    window = turns[len(turns) - kept:]
+    return head + [t.as_message() for t in window], len(turns) - kept
+
+
+def context_window(messages: List[Dict[str, Any]], budget: int = CONTEXT_TOKENS) -> List[Dict[str, Any]]:
+    """Window a client-supplied history when no server session is used."""
+    turns = [Turn(m["role"], m["content"]) for m in messages]
+    system: List[Turn] = []
+    for turn in turns:
+        if turn.role == "system" and all(t.content != turn.content for t in system):
+            system.append(turn)
+    window, _ = build_window(system, "", [t for t in turns if t.role != "system"], budget)
+    return window
+
+
+class ConversationStore:
+    """In-memory conversation sessions, evicted LRU and after ``SESSION_TTL`` idle."""
+
+    def __init__(self):
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._summaries: Set[asyncio.Task] = set()
+
+    def create(self) -> Session:
+        self._expire()
+        session = Session(uuid.uuid4().hex)
+        self._sessions[session.id] = session
+        while len(self._sessions) > MAX_SESSIONS:
+            self._sessions.popitem(last=False)
+        return session
+
+    def get(self, session_id: str) -> Optional[Session]:
+        session = self._sessions.get(session_id)
+        if session is None:
+            return None
+        if time.monotonic() - session.updated > SESSION_TTL:
+            del self._sessions[session_id]
+            return None
+        self._sessions.move_to_end(session_id)
+        return session
+
+    def delete(self, session_id: str) -> bool:
+        return self._sessions.pop(session_id, None) is not None
+
+    def _expire(self):
+        cutoff = time.monotonic() - SESSION_TTL
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            if oldest.updated > cutoff:
+                break
+            self._sessions.popitem(last=False)
+
+    def prepare(self, session: Session, delta: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Append the request's new turns and return the prompt window."""
+        session.append(delta)
+        window, dropped = build_window(session.system, session.summary, session.turns)
+        if dropped and SUMMARIZE and not session._summarizing:
+            session._summarizing = True
+            # Keep a reference, or the task can be garbage-collected mid-run.
+            task = asyncio.ensure_future(self._summarize(session, session.turns[:dropped]))
+            self._summaries.add(task)
+            task.add_done_callback(self._summaries.discard)
+        return window
+
+    def record_reply(self, session: Session, content: str):
+        if content:
+            session.append([{"role": "assistant", "content": content}])
+
+    async def _summarize(self, session: Session, turns: List[Turn]):
+        try:
+            async with model_limiter.slot(SUMMARY_MODEL, SUMMARY_PRIORITY):
+                summary = await rina_summarize(
+                    session.summary, [t.as_message() for t in turns], SUMMARY_MODEL, timeout=SUMMARY_TIMEOUT
+                )
+            # Only fold the turns away if nobody trimmed the history meanwhile.
+            if session.turns[: len(turns)] == turns:
+                del session.turns[: len(turns)]
+                session.summary = summary
+        except Exception as exc:
+            logger.warning(f"Summarizing session {session.id} failed: {exc}")
+        finally:
+            session._summarizing = False
+
+    async def shutdown(self):
+        tasks = list(self._summaries)
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+conversations = ConversationStore()
@@ -0,0 +1,158 @@
+import asyncio
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from rina_metrics import COALESCED_REQUESTS
+
+
+class _Call:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.subscribers = 0
+
+
+class SingleFlight:
+    """Run one upstream call per key; concurrent callers share its result.
+
+    The shared call is cancelled only when every caller waiting on it
+    has been cancelled.
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, _Call] = {}
+
+    async def do(self, key: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+        call = self._calls.get(key)
+        if call is None:
+            call = self._calls[key] = _Call(asyncio.ensure_future(factory()))
+            call.task.add_done_callback(lambda _: self._forget(key, call))
+        else:
+            COALESCED_REQUESTS.labels("json").inc()
+        call.subscribers += 1
+        try:
+            return await asyncio.shield(call.task)
+        finally:
+            call.subscribers -= 1
+            if call.subscribers == 0 and not call.task.done():
+                self._forget(key, call)
+                call.task.cancel()
+
+    def _forget(self, key: str, call: _Call):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+
+class _Broadcast:
+    def __init__(self):
+        self.buffer: List[Any] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.changed = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+
+    def notify(self):
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+
+class _Subscription:
+    """One subscriber's cursor over a broadcast.
+
+    ``aclose`` (called on exhaustion, or by the consumer when it stops
+    early) releases the subscription even if iteration never started.
+    """
+
+    def __init__(self, leave: Callable[[], None], flight: _Broadcast):
+        self._leave = leave
+        self._flight = flight
+        self._index = 0
+        self._closed = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> Any:
+        flight = self._flight
+        while True:
+            if self._closed:
+                raise StopAsyncIteration
+            changed = flight.changed
+            if self._index < len(flight.buffer):
+                self._index += 1
+                return flight.buffer[self._index - 1]
+            if flight.done:
+                await self.aclose()
+                if flight.error is not None:
+                    raise flight.error
+                raise StopAsyncIteration
+            await changed.wait()
+
+    async def aclose(self):
+        if not self._closed:
+            self._closed = True
+            self._leave()
+
+
+class StreamFlight:
+    """Fan one upstream token stream out to every identical concurrent request.
+
+    Late joiners first get the tokens buffered so far, then the live tail.
+    The upstream stream is cancelled when its last subscriber leaves.
+    """
+
+    def __init__(self):
+        self._flights: Dict[str, _Broadcast] = {}
+
+    def in_flight(self, key: str) -> bool:
+        return key in self._flights
+
+    def stream(self, key: str, factory: Callable[[], AsyncIterator[Any]],
+               on_done: Optional[Callable[[], None]] = None) -> Tuple[AsyncIterator[Any], bool]:
+        """Return ``(tokens, leader)``; ``factory`` is only called when ``leader``.
+
+        ``on_done`` runs once the leader's upstream has finished, even when
+        the pump is cancelled before it ever started.
+        """
+        flight = self._flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = self._flights[key] = _Broadcast()
+            flight.task = asyncio.ensure_future(self._pump(key, flight, factory()))
+            if on_done is not None:
+                flight.task.add_done_callback(lambda _: on_done())
+        else:
+            COALESCED_REQUESTS.labels("stream").inc()
+        flight.subscribers += 1
+        return _Subscription(lambda: self._leave(key, flight), flight), leader
+
+    async def _pump(self, key: str, flight: _Broadcast, upstream: AsyncIterator[Any]):
+        try:
+            async for token in upstream:
+                flight.buffer.append(token)
+                flight.notify()
+        except asyncio.CancelledError:
+            flight.error = asyncio.CancelledError()
+            raise
+        except Exception as exc:
+            flight.error = exc
+        finally:
+            flight.done = True
+            self._forget(key, flight)
+            flight.notify()
+            aclose = getattr(upstream, "aclose", None)
+            if aclose is not None:
+                await aclose()
+
+    def _leave(self, key: str, flight: _Broadcast):
+        flight.subscribers -= 1
+        if flight.subscribers == 0 and not flight.done:
+            self._forget(key, flight)
+            flight.task.cancel()
+
+    def _forget(self, key: str, flight: _Broadcast):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+
+json_flights = SingleFlight()
+stream_flights = StreamFlight()
@@ -0,0 +1,111 @@
+import logging
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from rina_metrics import (
+    GENERATIONS,
+    GENERATION_DURATION,
+    GENERATION_INTER_TOKEN,
+    GENERATION_QUEUE_WAIT,
+    GENERATION_TOKENS,
+    GENERATION_TOKENS_PER_SECOND,
+    GENERATION_TTFT,
+)
+
+logger = logging.getLogger("rina.generation")
+
+# Set per request by the request-id middleware (and by /ws/ai per frame);
+# tasks spawned while handling the request inherit them.
+request_id: ContextVar[Optional[str]] = ContextVar("rina_request_id", default=None)
+route: ContextVar[str] = ContextVar("rina_route", default="internal")
+# The provider the request asked for; set by the routes (and per item/frame).
+provider: ContextVar[Optional[str]] = ContextVar("rina_provider", default=None)
+# Set by the model limiter when a slot is granted.
+queue_wait: ContextVar[Optional[float]] = ContextVar("rina_queue_wait", default=None)
+
+
+def provider_of(model: str) -> str:
+    """Metrics label for the provider serving ``model``."""
+    if "/" in model:
+        return model.split("/", 1)[0]
+    # Bare names (gpt-4-turbo, claude-3-sonnet, mixtral-8x7b) only make sense with the request's provider.
+    return provider.get() or "unknown"
+
+
+class GenerationTimer:
+    """Times one upstream generation and records it when ``finish`` is called.
+
+    Call ``token()`` per streamed token and ``usage()`` with the upstream
+    usage block; ``finish(outcome)`` observes the metrics and writes one
+    structured log line carrying the request id.
+    """
+
+    def __init__(self, model: str, streaming: bool = False):
+        self.model = model
+        self.provider = provider_of(model)
+        self.route = route.get()
+        self.request_id = request_id.get()
+        self.queue_wait = queue_wait.get()
+        self.streaming = streaming
+        self.started = time.perf_counter()
+        self.first_token: Optional[float] = None
+        self.last_token: Optional[float] = None
+        self.tokens = 0
+        self.prompt_tokens: Optional[int] = None
+        self.completion_tokens: Optional[int] = None
+        self._labels = (self.route, self.provider, model)
+
+    def token(self):
+        now = time.perf_counter()
+        if self.first_token is None:
+            self.first_token = now
+        else:
+            GENERATION_INTER_TOKEN.labels(*self._labels).observe(now - self.last_token)
+        self.last_token = now
+        self.tokens += 1
+
+    def usage(self, usage):
+        if usage is not None:
+            self.prompt_tokens = getattr(usage, "prompt_tokens", None)
+            self.completion_tokens = getattr(usage, "completion_tokens", None)
+
+    def finish(self, outcome: str = "ok"):
+        duration = time.perf_counter() - self.started
+        labels = self._labels
+        completion = self.completion_tokens if self.completion_tokens is not None else self.tokens
+        ttft = None if self.first_token is None else self.first_token - self.started
+        tokens_per_second = None
+        if self.streaming and self.tokens > 1 and self.last_token > self.first_token:
+            # Decode rate: tokens after the first over the time they took.
+            tokens_per_second = (self.tokens - 1) / (self.last_token - self.first_token)
+        elif not self.streaming and completion and duration > 0:
+            tokens_per_second = completion / duration
+
+        GENERATIONS.labels(*labels, outcome).inc()
+        GENERATION_DURATION.labels(*labels).observe(duration)
+        if self.queue_wait is not None:
+            GENERATION_QUEUE_WAIT.labels(*labels).observe(self.queue_wait)
+        if ttft is not None:
+            GENERATION_TTFT.labels(*labels).observe(ttft)
+        if tokens_per_second is not None and outcome == "ok":
+            GENERATION_TOKENS_PER_SECOND.labels(*labels).observe(tokens_per_second)
+        if self.prompt_tokens:
+            GENERATION_TOKENS.labels(*labels, "prompt").inc(self.prompt_tokens)
+        if completion:
+            GENERATION_TOKENS.labels(*labels, "completion").inc(completion)
+
+        logger.info({
+            "event": "generation",
+            "rid": self.request_id,
+            "route": self.route,
+            "provider": self.provider,
+            "model": self.model,
+            "outcome": outcome,
+            "queue_wait_ms": None if self.queue_wait is None else round(self.queue_wait * 1000, 1),
+            "ttft_ms": None if ttft is None else round(ttft * 1000, 1),
+            "duration_ms": round(duration * 1000, 1),
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": completion,
+            "tokens_per_second": None if tokens_per_second is None else round(tokens_per_second, 1),
+        })
@@ -0,0 +1,198 @@
+import importlib.util
+import logging
+import os
+from typing import Dict, Optional
+
+import httpx
+import litellm
+from litellm.llms.custom_httpx.http_handler import AsyncHTTPHandler
+
+from rina_metrics import (
+    UPSTREAM_CONNECTIONS_OPENED,
+    UPSTREAM_ERRORS,
+    UPSTREAM_IN_FLIGHT,
+    UPSTREAM_POOL_HITS,
+    UPSTREAM_REQUESTS,
+)
+
+logger = logging.getLogger("rina.transport")
+
+# Configuration
+MAX_CONNECTIONS = int(os.getenv("RINA_UPSTREAM_MAX_CONNECTIONS", "100"))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("RINA_UPSTREAM_MAX_KEEPALIVE", "20"))
+KEEPALIVE_EXPIRY = float(os.getenv("RINA_UPSTREAM_KEEPALIVE_EXPIRY", "60"))
+CONNECT_TIMEOUT = float(os.getenv("RINA_UPSTREAM_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.getenv("RINA_UPSTREAM_READ_TIMEOUT", "120"))
+POOL_TIMEOUT = float(os.getenv("RINA_UPSTREAM_POOL_TIMEOUT", "10"))
+HTTP2_ENABLED = os.getenv("RINA_UPSTREAM_HTTP2", "true").lower() == "true"
+
+_CONNECT_EVENTS = ("connect_tcp.started", "connect_unix_socket.started")
+
+
+class _InstrumentedStream(httpx.AsyncByteStream):
+    def __init__(self, stream: httpx.AsyncByteStream, on_close):
+        self._stream = stream
+        self._on_close = on_close
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self._stream.aclose()
+        finally:
+            self._on_close()
+
+
+class _InstrumentedTransport(httpx.AsyncBaseTransport):
+    """Counts pool hits, new connections and in-flight requests.
+
+    A request counts as in flight until its response body is closed, so
+    streamed generations stay visible for their whole duration.
+    """
+
+    def __init__(self, name: str, inner: httpx.AsyncBaseTransport):
+        self.name = name
+        self._inner = inner
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        name = self.name
+        opened = False
+        parent_trace = request.extensions.get("trace")
+
+        async def trace(event_name, info):
+            nonlocal opened
+            if event_name.endswith(_CONNECT_EVENTS):
+                opened = True
+            if parent_trace is not None:
+                await parent_trace(event_name, info)
+
+        request.extensions["trace"] = trace
+        UPSTREAM_REQUESTS.labels(name).inc()
+        UPSTREAM_IN_FLIGHT.labels(name).inc()
+        try:
+            response = await self._inner.handle_async_request(request)
+        except BaseException:
+            UPSTREAM_IN_FLIGHT.labels(name).dec()
+            UPSTREAM_ERRORS.labels(name).inc()
+            raise
+        (UPSTREAM_CONNECTIONS_OPENED if opened else UPSTREAM_POOL_HITS).labels(name).inc()
+
+        closed = False
+
+        def on_close():
+            nonlocal closed
+            if not closed:
+                closed = True
+                UPSTREAM_IN_FLIGHT.labels(name).dec()
+
+        response.stream = _InstrumentedStream(response.stream, on_close)
+        return response
+
+    async def aclose(self):
+        await self._inner.aclose()
+
+
+class _UpstreamHTTPHandler(AsyncHTTPHandler):
+    """litellm handler bound to an upstream's pooled client.
+
+    litellm retries connection errors on a throwaway client from
+    ``create_client``; build that one with the upstream's limits and
+    instrumentation rather than litellm's default transport.
+    """
+
+    def __init__(self, upstream: "UpstreamTransport"):
+        self._upstream = upstream
+        super().__init__(timeout=upstream.client.timeout)
+
+    def create_client(self, *args, **kwargs) -> httpx.AsyncClient:
+        if not hasattr(self, "_client"):
+            return self._upstream.client
+        return self._upstream._build_client()
+
+
+class UpstreamTransport:
+    """One pooled HTTP client per upstream, shared by every route."""
+
+    def __init__(self, name: str, http2: bool = HTTP2_ENABLED):
+        self.name = name
+        self.http2 = http2 and importlib.util.find_spec("h2") is not None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._handler: Optional[AsyncHTTPHandler] = None
+
+    def _build_client(self) -> httpx.AsyncClient:
+        limits = httpx.Limits(
+            max_connections=MAX_CONNECTIONS,
+            max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=KEEPALIVE_EXPIRY,
+        )
+        timeout = httpx.Timeout(
+            connect=CONNECT_TIMEOUT, read=READ_TIMEOUT, write=READ_TIMEOUT, pool=POOL_TIMEOUT
+        )
+        inner = httpx.AsyncHTTPTransport(limits=limits, http2=self.http2, retries=1)
+        return httpx.AsyncClient(
+            transport=_InstrumentedTransport(self.name, inner),
+            timeout=timeout,
+            follow_redirects=True,
+        )
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = self._build_client()
+            self._handler = None
+        return self._client
+
+    @property
+    def handler(self) -> AsyncHTTPHandler:
+        """The shared client wrapped for litellm's ``client=`` argument."""
+        client = self.client
+        if self._handler is None:
+            handler = _UpstreamHTTPHandler(self)
+            handler.client = client
+            self._handler = handler
+        return self._handler
+
+    async def aclose(self):
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
+        self._handler = None
+
+
+class TransportRegistry:
+    """Transports keyed by upstream: each Ollama base URL plus one for cloud APIs."""
+
+    CLOUD = "cloud"
+
+    def __init__(self):
+        self._transports: Dict[str, UpstreamTransport] = {}
+
+    def get(self, name: str) -> UpstreamTransport:
+        transport = self._transports.get(name)
+        if transport is None:
+            # Ollama speaks plain HTTP/1.1; only TLS upstreams can negotiate h2.
+            http2 = HTTP2_ENABLED and not name.startswith("http://")
+            transport = self._transports[name] = UpstreamTransport(name, http2=http2)
+        return transport
+
+    def ollama(self, base_url: str) -> UpstreamTransport:
+        return self.get(base_url.rstrip("/"))
+
+    @property
+    def cloud(self) -> UpstreamTransport:
+        return self.get(self.CLOUD)
+
+    async def startup(self):
+        # litellm's OpenAI-compatible providers pick up this shared session.
+        litellm.aclient_session = self.cloud.client
+        logger.info("Upstream transports ready (http2=%s)", self.cloud.http2)
+
+    async def shutdown(self):
+        litellm.aclient_session = None
+        for transport in list(self._transports.values()):
+            await transport.aclose()
+
+
+transports = TransportRegistry()
@@ -0,0 +1,170 @@
+import asyncio
+import binascii
+import hashlib
+import io
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
+from fastapi import HTTPException, Request
+
+try:
+    from PIL import Image
+except ImportError:  # downscaling is optional
+    Image = None
+
+logger = logging.getLogger("rina.vision")
+
+# Configuration
+MAX_UPLOAD_BYTES = int(os.getenv("RINA_VISION_MAX_BYTES", str(20 * 1024 * 1024)))
+MAX_DIMENSION = int(os.getenv("RINA_VISION_MAX_DIM", "2048"))
+REENCODE_ABOVE_BYTES = int(os.getenv("RINA_VISION_REENCODE_BYTES", str(4 * 1024 * 1024)))
+JPEG_QUALITY = int(os.getenv("RINA_VISION_JPEG_QUALITY", "85"))
+IMAGE_WORKERS = int(os.getenv("RINA_VISION_WORKERS", "2"))
+
+_executor = ThreadPoolExecutor(max_workers=IMAGE_WORKERS, thread_name_prefix="rina-image")
+
+_SIGNATURES = (
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+)
+
+
+def sniff_mime(head: bytes, declared: Optional[str] = None) -> str:
+    for signature, mime in _SIGNATURES:
+        if head.startswith(signature):
+            return mime
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    if declared and declared.startswith("image/"):
+        return declared.split(";")[0].strip()
+    raise HTTPException(status_code=415, detail="Unsupported image type")
+
+
+async def read_image_body(request: Request, max_bytes: int = MAX_UPLOAD_BYTES) -> Tuple[bytearray, str]:
+    """Stream a raw image request body into one buffer, hashing as it arrives.
+
+    Returns ``(data, "sha256:<hex>")``. Rejects bodies over ``max_bytes``
+    with 413 before or while reading, so oversize uploads are never
+    buffered in full.
+    """
+    declared = request.headers.get("content-length")
+    if declared and declared.isdigit() and int(declared) > max_bytes:
+        raise HTTPException(status_code=413, detail=f"Image exceeds {max_bytes} bytes")
+    data = bytearray()
+    digest = hashlib.sha256()
+    async for chunk in request.stream():
+        if len(data) + len(chunk) > max_bytes:
+            raise HTTPException(status_code=413, detail=f"Image exceeds {max_bytes} bytes")
+        digest.update(chunk)
+        data += chunk
+    if not data:
+        raise HTTPException(status_code=400, detail="Image data required")
+    return data, "sha256:" + digest.hexdigest()
+
+
+class _BufferReader(io.RawIOBase):
+    """Seekable read-only file over a buffer, for ``Image.open``.
+
+    ``io.BytesIO(bytearray)`` would copy the whole image first; this only
+    copies what the decoder reads. Close it to unlock the buffer.
+    """
+
+    def __init__(self, data: bytearray):
+        self._view = memoryview(data)
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        n = max(0, min(len(buffer), len(self._view) - self._pos))
+        buffer[:n] = self._view[self._pos:self._pos + n]
+        self._pos += n
+        return n
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._pos, io.SEEK_END: len(self._view)}[whence]
+        self._pos = max(0, base + offset)
+        return self._pos
+
+    def tell(self) -> int:
+        return self._pos
+
+    def close(self):
+        if not self.closed:
+            self._view.release()
+        super().close()
+
+
+def _needs_shrink(data: bytearray) -> bool:
+    if len(data) > REENCODE_ABOVE_BYTES:
+        return True
+    if not MAX_DIMENSION:
+        return False
+    # Image.open only parses the header, so this reads a few KB of the image.
+    try:
+        with _BufferReader(data) as f, Image.open(f) as image:
+            return max(image.size) > MAX_DIMENSION
+    except Exception:
+        return True
+
+
+def _shrink(data: bytearray, mime: str) -> Tuple[bytes, str]:
+    """Downscale and/or re-encode an oversize image; runs in the worker pool."""
+    if not _needs_shrink(data):
+        return data, mime
+    with _BufferReader(data) as f, Image.open(f) as image:
+        too_large = MAX_DIMENSION and max(image.size) > MAX_DIMENSION
+        if too_large:
+            image.thumbnail((MAX_DIMENSION, MAX_DIMENSION))
+        out = io.BytesIO()
+        if image.mode in ("RGBA", "LA", "P"):
+            image.save(out, format="PNG", optimize=True)
+            return out.getvalue(), "image/png"
+        image.convert("RGB").save(out, format="JPEG", quality=JPEG_QUALITY)
+        return out.getvalue(), "image/jpeg"
+
+
+_ENCODE_CHUNK = 3 * 256 * 1024  # a multiple of 3, so chunks encode without padding
+
+
+def _encode_data_uri(data: bytes, mime: str) -> bytearray:
+    """The image as an ASCII ``data:`` URI, base64-encoded into one preallocated buffer."""
+    prefix = f"data:{mime};base64,".encode("ascii")
+    out = bytearray(len(prefix) + (len(data) + 2) // 3 * 4)
+    out[:len(prefix)] = prefix
+    view = memoryview(data)
+    pos = len(prefix)
+    for start in range(0, len(data), _ENCODE_CHUNK):
+        encoded = binascii.b2a_base64(view[start:start + _ENCODE_CHUNK], newline=False)
+        out[pos:pos + len(encoded)] = encoded
+        pos += len(encoded)
+    view.release()
+    return out
+
+
+async def prepare_image(data: bytearray, mime: str) -> str:
+    """Shrink if needed, then base64-encode, all off the event loop.
+
+    The raw buffer is cleared once the encoded buffer exists and before
+    the one copy into ``str``, so at most two full-size buffers (raw and
+    encoded, then encoded and the string) are alive at any time.
+    """
+    loop = asyncio.get_running_loop()
+    payload: bytes = data
+    if Image is not None and (MAX_DIMENSION or len(data) > REENCODE_ABOVE_BYTES):
+        try:
+            payload, mime = await loop.run_in_executor(_executor, _shrink, data, mime)
+        except Exception as exc:  # undecodable images go through unchanged
+            logger.warning(f"Image downscale skipped: {exc}")
+    encoded = await loop.run_in_executor(_executor, _encode_data_uri, payload, mime)
+    del payload
+    data.clear()
+    return await loop.run_in_executor(_executor, encoded.decode, "ascii")
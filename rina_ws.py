@@ -0,0 +1,201 @@
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from contextlib import aclosing
+from typing import Any, AsyncContextManager, AsyncIterator, Callable, Dict, Optional
+
+from fastapi import HTTPException, WebSocket
+from starlette.websockets import WebSocketDisconnect
+
+from rina_engine import Saturated
+from rina_provider_router import NoBackendAvailable
+from rina_quota import QuotaExceeded
+
+logger = logging.getLogger("rina.ws")
+
+# Configuration
+MAX_STREAMS_PER_CONNECTION = int(os.getenv("RINA_WS_MAX_STREAMS", "8"))
+SEND_QUEUE_FRAMES = int(os.getenv("RINA_WS_SEND_QUEUE", "64"))
+BATCH_MAX_CHARS = int(os.getenv("RINA_WS_BATCH_CHARS", "256"))
+BATCH_MAX_DELAY = float(os.getenv("RINA_WS_BATCH_MS", "20")) / 1000.0
+
+_END = object()
+
+
+async def batch_tokens(tokens: AsyncIterator[str], max_chars: int = BATCH_MAX_CHARS,
+                       max_delay: float = BATCH_MAX_DELAY) -> AsyncIterator[str]:
+    """Coalesce a token stream into chunks of up to ``max_chars``.
+
+    A chunk is flushed when it is full or when its first token has
+    waited ``max_delay`` seconds, so slow streams still flow promptly.
+    """
+    # Bounded, so a slow consumer stalls the reader and, through it, the upstream.
+    queue: asyncio.Queue = asyncio.Queue(max(1, max_chars))
+
+    async def read():
+        try:
+            async for token in tokens:
+                await queue.put(token)
+            await queue.put(_END)
+        except Exception as exc:
+            await queue.put(exc)
+        finally:
+            aclose = getattr(tokens, "aclose", None)
+            if aclose is not None:
+                await aclose()
+
+    reader = asyncio.ensure_future(read())
+    buffer = []
+    size = 0
+    deadline: Optional[float] = None
+    try:
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = await asyncio.wait_for(queue.get(), timeout)
+            except asyncio.TimeoutError:
+                item = None
+            if item is not None and item is not _END and not isinstance(item, Exception):
+                if not buffer:
+                    deadline = time.monotonic() + max_delay
+                buffer.append(item)
+                size += len(item)
+                if size < max_chars and time.monotonic() < deadline:
+                    continue
+            if buffer:
+                yield "".join(buffer)
+                buffer, size, deadline = [], 0, None
+            if isinstance(item, Exception):
+                raise item
+            if item is _END:
+                return
+    finally:
+        if not reader.done():
+            reader.cancel()
+        # Wait for the reader to leave ``tokens``; closing it while the reader is
+        # still inside would fail with "asynchronous generator is already running".
+        await asyncio.gather(reader, return_exceptions=True)
+
+
+class WebSocketMultiplexer:
+    """Framed, multiplexed generation protocol for one WebSocket.
+
+    Client frames::
+
+        {"type": "generate", "id": "r1", "content": "...", ...}
+        {"type": "cancel", "id": "r1"}
+
+    Server frames: ``start``, ``token`` (batched ``text``), ``done`` (with
+    ``finish_reason``) and ``error``, each tagged with the request ``id``.
+    Outbound frames go through a bounded queue drained by one writer, so
+    a slow reader applies backpressure to its upstream generations.
+
+    ``open_stream(frame)`` is an async context manager yielding the token
+    stream; leaving it releases the stream however the generation ends.
+
+    With ``expires_at`` (wall-clock seconds) the connection is closed with
+    code 1008 once that time passes, e.g. when the client's license lapses.
+    """
+
+    def __init__(self, websocket: WebSocket,
+                 open_stream: Callable[[Dict[str, Any]], AsyncContextManager[AsyncIterator[str]]],
+                 expires_at: Optional[float] = None):
+        self.websocket = websocket
+        self.open_stream = open_stream
+        self.expires_at = expires_at
+        self._outbox: asyncio.Queue = asyncio.Queue(SEND_QUEUE_FRAMES)
+        self._generations: Dict[str, asyncio.Task] = {}
+        self._closed = False
+
+    async def send(self, frame: Dict[str, Any]):
+        if not self._closed:
+            await self._outbox.put(frame)
+
+    async def _write_loop(self):
+        while True:
+            frame = await self._outbox.get()
+            await self.websocket.send_text(json.dumps(frame))
+            self._outbox.task_done()
+
+    async def _expire(self):
+        await asyncio.sleep(max(0.0, self.expires_at - time.time()))
+        tasks = list(self._generations.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self.send({"type": "error", "id": None, "error": "License expired", "status": 402})
+        await self._outbox.join()
+        self._closed = True
+        await self.websocket.close(code=1008, reason="License expired")
+
+    async def run(self):
+        writer = asyncio.ensure_future(self._write_loop())
+        expiry = asyncio.ensure_future(self._expire()) if self.expires_at is not None else None
+        try:
+            while True:
+                raw = await self.websocket.receive_text()
+                try:
+                    frame = json.loads(raw)
+                    if not isinstance(frame, dict):
+                        raise ValueError("frame must be an object")
+                except ValueError as exc:
+                    await self.send({"type": "error", "id": None, "error": f"Invalid frame: {exc}"})
+                    continue
+                await self._dispatch(frame)
+        except WebSocketDisconnect:
+            pass
+        finally:
+            self._closed = True
+            for task in list(self._generations.values()):
+                task.cancel()
+            if self._generations:
+                await asyncio.gather(*self._generations.values(), return_exceptions=True)
+            writer.cancel()
+            if expiry is not None:
+                expiry.cancel()
+
+    async def _dispatch(self, frame: Dict[str, Any]):
+        kind = frame.get("type", "generate")
+        rid = str(frame.get("id") or uuid.uuid4().hex)
+        if kind == "cancel":
+            task = self._generations.get(rid)
+            if task is not None:
+                task.cancel()
+            return
+        if kind != "generate":
+            await self.send({"type": "error", "id": rid, "error": f"Unknown frame type: {kind}"})
+            return
+        if rid in self._generations:
+            await self.send({"type": "error", "id": rid, "error": "Request id already in flight"})
+            return
+        if len(self._generations) >= MAX_STREAMS_PER_CONNECTION:
+            await self.send({"type": "error", "id": rid, "error": "Too many concurrent requests on this connection"})
+            return
+        self._generations[rid] = asyncio.ensure_future(self._generate(rid, frame))
+
+    async def _generate(self, rid: str, frame: Dict[str, Any]):
+        try:
+            async with self.open_stream(frame) as tokens:
+                await self.send({"type": "start", "id": rid})
+                async with aclosing(batch_tokens(tokens)) as chunks:
+                    async for text in chunks:
+                        await self.send({"type": "token", "id": rid, "text": text})
+            await self.send({"type": "done", "id": rid, "finish_reason": "stop"})
+        except asyncio.CancelledError:
+            if not self._closed:
+                await self.send({"type": "done", "id": rid, "finish_reason": "cancelled"})
+        except HTTPException as exc:
+            await self.send({"type": "error", "id": rid, "error": exc.detail, "status": exc.status_code})
+        except (Saturated, QuotaExceeded) as exc:
+            await self.send({"type": "error", "id": rid, "error": str(exc),
+                             "status": exc.status_code, "retry_after": exc.retry_after})
+        except NoBackendAvailable as exc:
+            await self.send({"type": "error", "id": rid, "error": str(exc), "status": 503})
+        except Exception as exc:
+            logger.error(f"WebSocket generation {rid} failed: {exc}")
+            await self.send({"type": "error", "id": rid, "error": "Internal server error", "status": 500})
+        finally:
+            self._generations.pop(rid, None)
@@ -2,22 +2,31 @@ import asyncio
 import os
 import json
 import logging
+import time
 import uuid
-import base64
+from contextlib import aclosing, asynccontextmanager
 from pathlib import Path
-from typing import Any, Dict, Optional, List
+from typing import Any, Dict, Literal, Optional, List, Union
 from fastapi import FastAPI, WebSocket, Depends, HTTPException, status, Header, Request
-from fastapi.responses import StreamingResponse, JSONResponse, PlainTextResponse
+from fastapi.responses import StreamingResponse, JSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.datastructures import Headers, MutableHeaders
 from pydantic import BaseModel, Field
 import uvicorn
-from slowapi import Limiter
-from slowapi.util import get_remote_address
-from slowapi.errors import RateLimitExceeded
 from prometheus_fastapi_instrumentator import Instrumentator
-import httpx
 from rina_litellm_config import rina_ollama_stream, rina_ollama_json, vision_chat
-from rina_provider_router import get_model
+from rina_provider_router import get_model, get_vision_model, ollama_pool, NoBackendAvailable
+from rina_transport import transports
+from rina_cache import response_cache, make_key, CACHE_HEADER
+from rina_engine import model_limiter, run_until_disconnect, Saturated, ClientDisconnected
+from rina_singleflight import json_flights, stream_flights
+from rina_sessions import conversations, context_window
+from rina_ws import WebSocketMultiplexer
+from rina_batch import batch_jobs, run_batch, clamp_concurrency, MAX_BATCH_ITEMS
+from rina_license import license_verifier
+from rina_quota import quotas, QuotaExceeded
+import rina_telemetry as telemetry
+from rina_vision import read_image_body, sniff_mime, prepare_image, MAX_DIMENSION
                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                             
 # Logging setup
 logger = logging.getLogger("rina")
@@ -26,12 +35,8 @@ logging.basicConfig(level=logging.INFO)
 # Configuration
 ADMIN_API_KEY = os.getenv("ADMIN_API_KEY")
 REQUIRE_VALID_LICENSE = os.getenv("REQUIRE_VALID_LICENSE", "false").lower() == "true"
-LICENSE_PUBLIC_KEY_PATH = os.getenv("LICENSE_PUBLIC_KEY_PATH")
 CORS_ORIGINS = [o.strip() for o in os.getenv("CORS_ORIGINS", "").split(",") if o.strip()]
 
-# HTTP client for connection pooling
-http_client = httpx.AsyncClient(timeout=30.0)
-
 # Authentication functions
 async def require_admin(x_rina_key: str = Header(None)):
    if not ADMIN_API_KEY:
@@ -42,23 +47,43 @@ async def require_admin(x_rina_key: str = Header(None)):
 def verify_license(license_token: str) -> bool:
    if not REQUIRE_VALID_LICENSE:
        return True
-   if not license_token:
-       return False
-   try:
-       payload = json.loads(base64.b64decode(license_token.split(".")[1] + "=="))
-       # TODO: verify signature using LICENSE_PUBLIC_KEY_PATH
-       return payload.get("exp", 0) > int(asyncio.get_event_loop().time())
-   except Exception:
-       return False
+   # Signature and expiry are checked once per token, then served from cache
+   return license_verifier.verify(license_token) is not None
 
 async def require_license(x_rina_license: str = Header(None)):
    if REQUIRE_VALID_LICENSE and not verify_license(x_rina_license or ""):
        raise HTTPException(status_code=402, detail="Payment Required / Invalid License")
+
+def identify(client, x_rina_license: Optional[str], x_rina_key: Optional[str] = None):
+   """License check; returns ``(principal, license)``.
+
+   The principal is who the request is charged to (admin key, license
+   holder or client address); its tier also sets its queue priority.
+   """
+   admin = bool(ADMIN_API_KEY) and x_rina_key == ADMIN_API_KEY
+   license = None if admin or not x_rina_license else license_verifier.verify(x_rina_license)
+   if REQUIRE_VALID_LICENSE and license is None and not admin:
+       raise HTTPException(status_code=402, detail="Payment Required / Invalid License")
+   return quotas.principal(license, admin, client.host if client else None), license
+
+async def authorize(client, x_rina_license: Optional[str], x_rina_key: Optional[str] = None):
+   """License check plus quota admission for a generation request."""
+   principal, _ = identify(client, x_rina_license, x_rina_key)
+   await quotas.admit(principal)
+   return principal
                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                             
 # Pydantic models
+class TextPart(BaseModel):
+   type: Literal["text"]
+   text: str
+
+class ImagePart(BaseModel):
+   type: Literal["image_url"]
+   image_url: Union[str, Dict[str, Any]]
+
 class ChatMessage(BaseModel):
    role: str
-   content: Any
+   content: Union[str, List[Union[TextPart, ImagePart]]]
 
 class ChatBody(BaseModel):
    provider: str = "local"
@@ -73,41 +98,210 @@ class VisionBody(BaseModel):
 # FastAPI app
 app = FastAPI(title="RinaWarp Ollama Bridge")
 
-# Rate limiting
-limiter = Limiter(key_func=get_remote_address)
-
-@app.exception_handler(RateLimitExceeded)
-def _rate_limit_handler(request, exc):
-   return PlainTextResponse("Too Many Requests", status_code=429)
+@app.exception_handler(QuotaExceeded)
+def _quota_handler(request, exc: QuotaExceeded):
+   return JSONResponse(
+       {"detail": str(exc), "retry_after": exc.retry_after},
+       status_code=exc.status_code,
+       headers={"Retry-After": str(exc.retry_after)},
+   )
+
+@app.exception_handler(Saturated)
+def _saturated_handler(request, exc: Saturated):
+   return JSONResponse(
+       {"detail": str(exc), "retry_after": exc.retry_after},
+       status_code=exc.status_code,
+       headers={"Retry-After": str(exc.retry_after)},
+   )
+
+@app.exception_handler(NoBackendAvailable)
+def _no_backend_handler(request, exc: NoBackendAvailable):
+   return JSONResponse({"detail": str(exc)}, status_code=503)
 
 # CORS middleware
 app.add_middleware(
    CORSMiddleware,
    allow_origins=CORS_ORIGINS or ["http://localhost:5173"],
    allow_credentials=True,
-   allow_methods=["GET", "POST"],
-   allow_headers=["Content-Type", "X-RINA-KEY", "X-RINA-LICENSE", "X-Request-ID"],
+   allow_methods=["GET", "POST", "DELETE"],
+   allow_headers=["Content-Type", "Cache-Control", "X-RINA-KEY", "X-RINA-LICENSE", "X-RINA-CACHE", "X-Request-ID"],
+   expose_headers=["X-RINA-CACHE", "X-Request-ID", "Location"],
 )
                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                             
-# Prometheus metrics
+# Prometheus metrics (middleware must be added before the app starts)
+Instrumentator().instrument(app).expose(app, include_in_schema=False, endpoint="/metrics")
+
+# Upstream transport lifecycle
 @app.on_event("startup")
 async def _startup():
-   Instrumentator().instrument(app).expose(app, include_in_schema=False, endpoint="/metrics")
+   await transports.startup()
+   await ollama_pool.start()
+
+@app.on_event("shutdown")
+async def _shutdown():
+   await batch_jobs.shutdown()
+   await conversations.shutdown()
+   await ollama_pool.stop()
+   await transports.shutdown()
+   response_cache.close()
+   await quotas.close()
 
 # Request ID middleware
-@app.middleware("http")
-async def add_request_id(request: Request, call_next):
-   rid = request.headers.get("x-request-id", str(uuid.uuid4()))
-   response = await call_next(request)
-   response.headers["x-request-id"] = rid
-   logger.info({
-       "event": "request",
-       "rid": rid,
-       "path": request.url.path,
-       "method": request.method,
-       "status_code": response.status_code
-   })
-   return response
+class RequestIdMiddleware:
+   """Tags each request with an id, for response headers, logs and generation metrics.
+
+   Plain ASGI rather than ``@app.middleware("http")``: that wraps
+   ``receive``, and behind it ``request.is_disconnected()`` never sees the
+   client hang up, so ``run_until_disconnect`` could not cancel anything.
+   """
+
+   def __init__(self, app):
+       self.app = app
+
+   async def __call__(self, scope, receive, send):
+       if scope["type"] != "http":
+           await self.app(scope, receive, send)
+           return
+       rid = Headers(scope=scope).get("x-request-id") or str(uuid.uuid4())
+       path = scope["path"]
+       # Generation log lines and metrics pick these up from the request's context
+       telemetry.request_id.set(rid)
+       telemetry.route.set(path)
+       started = time.perf_counter()
+
+       async def send_with_id(message):
+           if message["type"] == "http.response.start":
+               MutableHeaders(scope=message)["x-request-id"] = rid
+               logger.info({
+                   "event": "request",
+                   "rid": rid,
+                   "path": path,
+                   "method": scope["method"],
+                   "status_code": message["status"],
+                   # Until the response starts; streamed bodies are timed by the generation log line
+                   "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+               })
+           await send(message)
+
+       await self.app(scope, receive, send_with_id)
+
+app.add_middleware(RequestIdMiddleware)
+
+def completion_to_dict(response) -> Dict[str, Any]:
+    # Convert ModelResponse to dict for JSON serialization
+    return {
+        "id": response.id,
+        "object": "chat.completion",
+        "created": response.created,
+        "model": response.model,
+        "choices": [{
+            "index": choice.index,
+            "message": {
+                "role": choice.message.role,
+                "content": choice.message.content
+            },
+            "finish_reason": choice.finish_reason
+        } for choice in response.choices],
+        "usage": {
+            "prompt_tokens": response.usage.prompt_tokens,
+            "completion_tokens": response.usage.completion_tokens,
+            "total_tokens": response.usage.total_tokens
+        }
+    }
+
+async def resolve_prompt(session_id: Optional[str], content: Optional[str], messages: Optional[List[Any]] = None,
+                         principal=None):
+    """Turn a request's new turns into ``(session, prompt_messages)``.
+
+    With a session the request carries only its delta; the stored history
+    is windowed to the context budget. Without one, a client-supplied
+    history is windowed the same way. With ``principal`` the quota is
+    admitted once the body and session check out, so 400s and 404s cost
+    nothing, and before the session records the new turns.
+    """
+    if not messages and not content:
+        raise HTTPException(status_code=400, detail="Either content or messages required")
+    try:
+        if messages:
+            delta = [ChatMessage(**m).model_dump() for m in messages]
+        else:
+            delta = [ChatMessage(role="user", content=content).model_dump()]
+    except (TypeError, ValueError):
+        raise HTTPException(
+            status_code=400,
+            detail="messages must be a list of {role, content}; content is text or a list of text/image_url parts",
+        )
+
+    session = None
+    if session_id:
+        session = conversations.get(session_id)
+        if session is None:
+            raise HTTPException(status_code=404, detail="Unknown or expired session")
+    if principal is not None:
+        await quotas.admit(principal)
+    if session is None:
+        return None, context_window(delta)
+    return session, conversations.prepare(session, delta)
+
+async def complete_json(headers, model: str, prompt: List[Dict[str, Any]], principal):
+    """JSON completion through the cache, coalescing and the model limiter; returns ``(body, cache_status)``."""
+    cache_key = make_key(model, prompt, {"format": "json"})
+    body, cache_status = await response_cache.lookup(headers, cache_key)
+    if body is None:
+        async def generate_json():
+            async with model_limiter.slot(model, principal.priority):
+                return await rina_ollama_json(prompt, model)
+
+        body = completion_to_dict(await json_flights.do(cache_key, generate_json))
+        await response_cache.store(headers, cache_key, body)
+        await quotas.charge(principal, body["usage"]["completion_tokens"] or 0)
+    return body, cache_status
+
+async def coalesced_stream(model: str, prompt: List[Dict[str, Any]], priority: int = 0):
+    """Token stream for a prompt, shared with identical in-flight requests.
+
+    Only the request that starts the upstream generation takes a model
+    slot; joiners ride along on the leader's slot.
+    """
+    flight_key = make_key(model, prompt, {"stream": True})
+    lease = None if stream_flights.in_flight(flight_key) else await model_limiter.acquire(model, priority)
+    tokens, leader = stream_flights.stream(
+        flight_key, lambda: rina_ollama_stream(prompt, model), on_done=lease.release if lease else None
+    )
+    if lease is not None and not leader:
+        lease.release()
+    return tokens
+
+@asynccontextmanager
+async def open_generation(principal, session, model: str, prompt: List[Dict[str, Any]]):
+    """Coalesced, metered token stream for one request, released on exit.
+
+    The flight subscription is closed here rather than through the
+    wrapping generators: closing those before their first step would
+    never reach it, and the upstream would keep its slot.
+    """
+    subscription = await coalesced_stream(model, prompt, principal.priority)
+    async with aclosing(subscription):
+        async with aclosing(quotas.metered(principal, relay_reply(session, subscription))) as tokens:
+            yield tokens
+
+def sse_error(status_code: int, detail: str, retry_after: Optional[int] = None) -> str:
+    error = {"detail": detail, "status": status_code}
+    if retry_after is not None:
+        error["retry_after"] = retry_after
+    return f"event: error\ndata: {json.dumps(error)}\n\n"
+
+async def relay_reply(session, tokens):
+    """Pass tokens through and store the full reply once the stream completes."""
+    reply = []
+    try:
+        async for token in tokens:
+            reply.append(token)
+            yield token
+    finally:
+        await tokens.aclose()
+    if session is not None:
+        conversations.record_reply(session, "".join(reply))
 
 @app.get("/health")
 async def health_check():
@@ -115,15 +309,33 @@ async def health_check():
 
 @app.get("/admin/health")
 async def admin_health_check(_=Depends(require_admin)):
+    backends = ollama_pool.snapshot()
+    running = [b for b in backends if b["status"] == "running"]
     return {
-        "status": "healthy",
+        "status": "healthy" if len(running) == len(backends) else ("degraded" if running else "unhealthy"),
         "service": "rina-ollama-bridge",
-        "ollama_status": "running",  # TODO: check actual ollama status
+        "ollama_status": "running" if running else "down",
+        "ollama_backends": backends,
         "version": "1.0.0"
     }
 
+@app.post("/sessions")
+async def create_session(x_rina_license: str = Header(None)):
+    if REQUIRE_VALID_LICENSE and not verify_license(x_rina_license or ""):
+        raise HTTPException(status_code=402, detail="Payment Required / Invalid License")
+    return {"session_id": conversations.create().id}
+
+@app.delete("/sessions/{session_id}")
+async def delete_session(session_id: str, x_rina_license: str = Header(None)):
+    if REQUIRE_VALID_LICENSE and not verify_license(x_rina_license or ""):
+        raise HTTPException(status_code=402, detail="Payment Required / Invalid License")
+    if not conversations.delete(session_id):
+        raise HTTPException(status_code=404, detail="Unknown or expired session")
+    return {"deleted": session_id}
+
 @app.post("/chat")
-async def chat_endpoint(payload: Dict[str, Any], x_rina_license: str = Header(None)):
+async def chat_endpoint(request: Request, payload: Dict[str, Any], x_rina_license: str = Header(None),
+                        x_rina_key: str = Header(None)):
     # Validate request
     if not payload:
         raise HTTPException(status_code=400, detail="Request body required")
@@ -135,51 +347,114 @@ async def chat_endpoint(payload: Dict[str, Any], x_rina_license: str = Header(No
     if not content and not messages:
         raise HTTPException(status_code=400, detail="Either content or messages required")
 
-    # License check
-    if REQUIRE_VALID_LICENSE and not verify_license(x_rina_license or ""):
-        raise HTTPException(status_code=402, detail="Payment Required / Invalid License")
+    # License check, then quota once the prompt is valid
+    principal, _ = identify(request.client, x_rina_license, x_rina_key)
 
+    session, prompt = await resolve_prompt(payload.get("session_id"), content, messages, principal)
     model = get_model(provider)
-    response = await asyncio.get_event_loop().run_in_executor(
-        None, lambda: asyncio.run(rina_ollama_json(content, model))
-    )
+    telemetry.provider.set(provider)
+    try:
+        body, cache_status = await run_until_disconnect(request, complete_json(request.headers, model, prompt, principal))
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Upstream model timed out")
+    except ClientDisconnected:
+        return Response(status_code=499)
+
+    if session is not None:
+        conversations.record_reply(session, body["choices"][0]["message"]["content"] if body["choices"] else "")
+        body = {**body, "session_id": session.id}
+    return JSONResponse(body, headers={CACHE_HEADER: cache_status})
+
+@app.post("/chat/batch")
+async def chat_batch_endpoint(request: Request, payload: Dict[str, Any], x_rina_license: str = Header(None),
+                              x_rina_key: str = Header(None)):
+    """Run many independent JSON completions in one request.
+
+    ``items`` is a list of ``{id?, content | messages, provider?}``. Results
+    stream back as NDJSON in completion order, one line per item with its
+    own ``status``; with ``"mode": "async"`` a job is queued instead and
+    polled via ``GET /chat/batch/{job_id}``.
+    """
+    items = payload.get("items")
+    if not isinstance(items, list) or not items:
+        raise HTTPException(status_code=400, detail="items must be a non-empty list")
+    if len(items) > MAX_BATCH_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Batch exceeds {MAX_BATCH_ITEMS} items")
+
+    # License check (once for the whole batch); each item is then admitted against the quota
+    principal, _ = identify(request.client, x_rina_license, x_rina_key)
 
-    # Convert ModelResponse to dict for JSON serialization
-    return JSONResponse({
-        "id": response.id,
-        "object": "chat.completion",
-        "created": response.created,
-        "model": response.model,
-        "choices": [{
-            "index": choice.index,
-            "message": {
-                "role": choice.message.role,
-                "content": choice.message.content
-            },
-            "finish_reason": choice.finish_reason
-        } for choice in response.choices],
-        "usage": {
-            "prompt_tokens": response.usage.prompt_tokens,
-            "completion_tokens": response.usage.completion_tokens,
-            "total_tokens": response.usage.total_tokens
-        }
-    })
+    provider = payload.get("provider", "local")
+    concurrency = clamp_concurrency(payload.get("concurrency"))
+    headers = dict(request.headers)  # async jobs outlive the request
+
+    async def run_item(item):
+        if not isinstance(item, dict):
+            raise HTTPException(status_code=400, detail="Each item must be an object")
+        _, prompt = await resolve_prompt(None, item.get("content"), item.get("messages"), principal)
+        # Each item runs in its own task, so this labels just this item's generation
+        telemetry.provider.set(item.get("provider", provider))
+        body, cache_status = await complete_json(headers, get_model(item.get("provider", provider)), prompt, principal)
+        return {"response": body, "cache": cache_status}
+
+    if payload.get("mode") == "async":
+        job = batch_jobs.submit(items, run_item, concurrency)
+        return JSONResponse(
+            {"job_id": job.id, "status": job.status, "total": job.total},
+            status_code=202,
+            headers={"Location": f"/chat/batch/{job.id}"},
+        )
+
+    async def generate():
+        async with aclosing(run_batch(items, run_item, concurrency)) as results:
+            async for result in results:
+                yield json.dumps(result) + "\n"
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+@app.get("/chat/batch/{job_id}")
+async def chat_batch_status(job_id: str, offset: int = 0, x_rina_license: str = Header(None)):
+    if REQUIRE_VALID_LICENSE and not verify_license(x_rina_license or ""):
+        raise HTTPException(status_code=402, detail="Payment Required / Invalid License")
+    job = batch_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired batch job")
+    return job.snapshot(offset)
+
+@app.delete("/chat/batch/{job_id}")
+async def chat_batch_cancel(job_id: str, x_rina_license: str = Header(None)):
+    if REQUIRE_VALID_LICENSE and not verify_license(x_rina_license or ""):
+        raise HTTPException(status_code=402, detail="Payment Required / Invalid License")
+    job = batch_jobs.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired batch job")
+    return {"job_id": job.id, "status": "cancelling" if job.status == "running" else job.status}
 
 @app.get("/sse")
-async def sse_endpoint(content: str, provider: str = "local", x_rina_license: str = Header(None)):
+async def sse_endpoint(request: Request, content: str, provider: str = "local", session_id: Optional[str] = None,
+                       x_rina_license: str = Header(None), x_rina_key: str = Header(None)):
     # Validate request
     if not content:
         raise HTTPException(status_code=400, detail="Content parameter required")
 
-    # License check
-    if REQUIRE_VALID_LICENSE and not verify_license(x_rina_license or ""):
-        raise HTTPException(status_code=402, detail="Payment Required / Invalid License")
+    # License check, then quota once the prompt is valid
+    principal, _ = identify(request.client, x_rina_license, x_rina_key)
 
+    session, prompt = await resolve_prompt(session_id, content, principal=principal)
     model = get_model(provider)
+    telemetry.provider.set(provider)
 
+    # The flight is opened inside the body, so a response that is never sent holds nothing;
+    # a saturated lane is therefore reported as an error event rather than a status code.
     async def generate():
-        async for token in rina_ollama_stream(content, model):
-            yield f"data: {token}\n\n"
+        try:
+            async with open_generation(principal, session, model, prompt) as tokens:
+                async for token in tokens:
+                    yield f"data: {token}\n\n"
+        except Saturated as exc:
+            yield sse_error(exc.status_code, str(exc), exc.retry_after)
+        except NoBackendAvailable as exc:
+            yield sse_error(503, str(exc))
 
     return StreamingResponse(
         generate(),
@@ -187,41 +462,39 @@ async def sse_endpoint(content: str, provider: str = "local", x_rina_license: st
         headers={
             "Cache-Control": "no-cache",
             "Connection": "keep-alive",
-        }
+        },
     )
 
 @app.websocket("/ws/ai")
-async def websocket_endpoint(websocket: WebSocket, x_rina_license: str = Header(None)):
-    await websocket.accept()
-
+async def websocket_endpoint(websocket: WebSocket, x_rina_license: str = Header(None),
+                             x_rina_key: str = Header(None)):
+    # License check (once per connection; the multiplexer closes it when the license expires)
     try:
-        while True:
-            data = await websocket.receive_text()
-            payload = json.loads(data)
-
-            # Validate request
-            content = payload.get("content", "")
-            if not content:
-                await websocket.send_text(json.dumps({"error": "Content required"}))
-                continue
-
-            # License check
-            if REQUIRE_VALID_LICENSE and not verify_license(x_rina_license or ""):
-                await websocket.send_text(json.dumps({"error": "Payment Required / Invalid License"}))
-                continue
-
-            provider = payload.get("provider", "local")
-            model = get_model(provider)
-
-            async for token in rina_ollama_stream(content, model):
-                await websocket.send_text(token)
-
-    except Exception as e:
-        logger.error(f"WebSocket error: {e}")
-        await websocket.send_text(json.dumps({"error": "Internal server error"}))
+        principal, license = identify(websocket.client, x_rina_license, x_rina_key)
+    except HTTPException as exc:
+        await websocket.close(code=1008, reason=exc.detail)
+        return
+    expires_at = license.expires_at if REQUIRE_VALID_LICENSE and license is not None else None
+    await websocket.accept()
+    connection_id = websocket.headers.get("x-request-id", str(uuid.uuid4()))
+    telemetry.route.set("/ws/ai")
+
+    @asynccontextmanager
+    async def open_stream(frame: Dict[str, Any]):
+        # Each frame runs in its own task, so this tags just this generation
+        telemetry.request_id.set(f"{connection_id}:{frame.get('id', '')}")
+        session, prompt = await resolve_prompt(frame.get("session_id"), frame.get("content"), frame.get("messages"),
+                                               principal)
+        model = get_model(frame.get("provider", "local"))
+        telemetry.provider.set(frame.get("provider", "local"))
+        async with open_generation(principal, session, model, prompt) as tokens:
+            yield tokens
+
+    await WebSocketMultiplexer(websocket, open_stream, expires_at).run()
 
 @app.post("/vision")
-async def vision_endpoint(payload: Dict[str, Any], x_rina_license: str = Header(None)):
+async def vision_endpoint(request: Request, payload: Dict[str, Any], x_rina_license: str = Header(None),
+                          x_rina_key: str = Header(None)):
     # Validate request
     image = payload.get("image")
     if not image:
@@ -230,34 +503,66 @@ async def vision_endpoint(payload: Dict[str, Any], x_rina_license: str = Header(
     prompt = payload.get("prompt", "What do you see?")
     provider = payload.get("provider", "local")
 
-    # License check
-    if REQUIRE_VALID_LICENSE and not verify_license(x_rina_license or ""):
-        raise HTTPException(status_code=402, detail="Payment Required / Invalid License")
-
-    model = get_model(provider).replace("llama", "llava")  # Use vision model
+    # License check and quota
+    principal = await authorize(request.client, x_rina_license, x_rina_key)
+
+    model = get_vision_model(provider)
+    telemetry.provider.set(provider)
+    cache_key = make_key(model, [{"role": "user", "content": [
+        {"type": "text", "text": prompt},
+        {"type": "image_url", "image_url": {"url": image}},
+    ]}])
+
+    async def load_image():
+        return image
+
+    return await answer_vision(request, model, cache_key, load_image, prompt, principal)
+
+@app.post("/vision/upload")
+async def vision_upload_endpoint(request: Request, prompt: str = "What do you see?", provider: str = "local",
+                                 x_rina_license: str = Header(None), x_rina_key: str = Header(None)):
+    """Raw image body (``Content-Type: image/*``); prompt and provider as query params."""
+    # License check before reading the body; quota once the image checks out
+    principal, _ = identify(request.client, x_rina_license, x_rina_key)
+
+    data, digest = await read_image_body(request)
+    mime = sniff_mime(bytes(data[:16]), request.headers.get("content-type"))
+    await quotas.admit(principal)
+    model = get_vision_model(provider)
+    telemetry.provider.set(provider)
+    cache_key = make_key(model, [{"role": "user", "content": [
+        {"type": "text", "text": prompt},
+        {"type": "image", "digest": digest},
+    ]}], {"max_dim": MAX_DIMENSION})
+
+    async def load_image():
+        return await prepare_image(data, mime)
+
+    return await answer_vision(request, model, cache_key, load_image, prompt, principal)
+
+async def answer_vision(request: Request, model: str, cache_key: str, load_image, prompt: str, principal):
+    """Shared cache/limiter flow for both vision routes; the image is only encoded on a cache miss."""
+    cached, cache_status = await response_cache.lookup(request.headers, cache_key)
+    if cached is not None:
+        return JSONResponse(cached, headers={CACHE_HEADER: cache_status})
 
-    result = await vision_chat(image, prompt, model)
+    async def generate():
+        # Prepare (decode, downscale, encode) before taking a slot, so CPU work never holds the model.
+        image = await load_image()
+        async with model_limiter.slot(model, principal.priority):
+            return await vision_chat(image, prompt, model)
 
-    # Convert ModelResponse to dict for JSON serialization
-    return JSONResponse({
-        "id": result.id,
-        "object": "chat.completion",
-        "created": result.created,
-        "model": result.model,
-        "choices": [{
-            "index": choice.index,
-            "message": {
-                "role": choice.message.role,
-                "content": choice.message.content
-            },
-            "finish_reason": choice.finish_reason
-        } for choice in result.choices],
-        "usage": {
-            "prompt_tokens": result.usage.prompt_tokens,
-            "completion_tokens": result.usage.completion_tokens,
-            "total_tokens": result.usage.total_tokens
-        }
-    })
+    try:
+        result = await run_until_disconnect(request, generate())
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Upstream model timed out")
+    except ClientDisconnected:
+        return Response(status_code=499)
+
+    body = completion_to_dict(result)
+    await response_cache.store(request.headers, cache_key, body)
+    await quotas.charge(principal, body["usage"]["completion_tokens"] or 0)
+    return JSONResponse(body, headers={CACHE_HEADER: cache_status})
 
 if __name__ == "__main__":
     host = os.getenv("HOST", "0.0.0.0")
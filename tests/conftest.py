@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The bridge modules live at the repository root and read their configuration at import time.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("LITELLM_LOCAL_MODEL_COST_MAP", "True")
@@ -0,0 +1,30 @@
+import asyncio
+import sqlite3
+
+from rina_cache import ResponseCache
+
+
+def test_disk_read_errors_are_cache_misses(tmp_path, monkeypatch):
+    cache = ResponseCache(enabled=True, directory=str(tmp_path))
+
+    def locked(key):
+        raise sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(cache.disk, "get", locked)
+
+    async def scenario():
+        assert await cache.get("missing") is None
+        await cache.put("key", {"answer": 42})
+        assert await cache.get("key") == {"answer": 42}  # still served from memory
+
+    asyncio.run(scenario())
+    cache.close()
+
+
+def test_disk_tier_survives_a_fresh_memory_tier(tmp_path):
+    first = ResponseCache(enabled=True, directory=str(tmp_path))
+    asyncio.run(first.put("key", {"answer": 42}))
+    first.close()
+    second = ResponseCache(enabled=True, directory=str(tmp_path))
+    assert asyncio.run(second.get("key")) == {"answer": 42}
+    second.close()
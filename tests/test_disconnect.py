@@ -0,0 +1,74 @@
+import asyncio
+import json
+
+import server
+from rina_engine import model_limiter
+from rina_singleflight import json_flights
+
+
+async def call_and_hang_up(path: str, body: dict, hang_up_after: float):
+    """Drive the app over raw ASGI; the client disconnects after ``hang_up_after`` seconds."""
+    payload = json.dumps(body).encode()
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(payload)).encode())],
+        "client": ("127.0.0.1", 50000),
+        "server": ("127.0.0.1", 7071),
+    }
+    gone = asyncio.Event()
+    sent_body = False
+    messages = []
+
+    async def receive():
+        nonlocal sent_body
+        if not sent_body:
+            sent_body = True
+            return {"type": "http.request", "body": payload, "more_body": False}
+        await gone.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        messages.append(message)
+
+    async def hang_up():
+        await asyncio.sleep(hang_up_after)
+        gone.set()
+
+    asyncio.ensure_future(hang_up())
+    await asyncio.wait_for(server.app(scope, receive, send), 5)
+    return messages
+
+
+def test_chat_disconnect_frees_the_model_lane(monkeypatch):
+    upstream = {"started": 0, "cancelled": 0}
+
+    async def slow_json(prompt, model, timeout=None):
+        upstream["started"] += 1
+        try:
+            await asyncio.sleep(30)
+        except asyncio.CancelledError:
+            upstream["cancelled"] += 1
+            raise
+
+    monkeypatch.setattr(server, "rina_ollama_json", slow_json)
+    model = server.get_model("local")
+
+    async def scenario():
+        messages = await call_and_hang_up("/chat", {"content": "slow disconnect test"}, 0.3)
+        await asyncio.sleep(0)
+        return messages
+
+    messages = asyncio.run(scenario())
+
+    assert upstream == {"started": 1, "cancelled": 1}
+    assert messages[0]["status"] == 499
+    assert model_limiter.snapshot()[model]["active"] == 0
+    assert not json_flights._calls
@@ -0,0 +1,124 @@
+import asyncio
+
+import httpx
+import litellm
+import pytest
+
+from rina_engine import ModelLimiter, Saturated
+from rina_provider_router import Backend, BackendPool, EJECT_AFTER_FAILURES, is_backend_failure
+
+MODEL = "ollama/llama2"
+
+
+def wrapped(cause: BaseException) -> litellm.APIConnectionError:
+    """What litellm raises: its own error, chained to the real one."""
+    try:
+        try:
+            raise cause
+        except BaseException as exc:
+            raise litellm.APIConnectionError(message=str(exc), llm_provider="ollama", model="llama2") from exc
+    except litellm.APIConnectionError as error:
+        return error
+
+
+def status_error(status: int) -> httpx.HTTPStatusError:
+    request = httpx.Request("POST", "http://backend/api/chat")
+    return httpx.HTTPStatusError("upstream", request=request, response=httpx.Response(status, request=request))
+
+
+def test_client_side_errors_are_not_backend_failures():
+    assert not is_backend_failure(wrapped(TypeError("'int' object is not iterable")))
+    assert not is_backend_failure(wrapped(status_error(400)))
+    assert not is_backend_failure(ValueError("bad input"))
+
+
+def test_transport_errors_timeouts_and_5xx_are_backend_failures():
+    assert is_backend_failure(wrapped(httpx.ConnectError("refused")))
+    assert is_backend_failure(wrapped(httpx.ReadTimeout("slow")))
+    assert is_backend_failure(wrapped(status_error(502)))
+    assert is_backend_failure(asyncio.TimeoutError())
+
+
+async def fail_through(pool: BackendPool, error: BaseException, times: int):
+    for _ in range(times):
+        with pytest.raises(type(error)):
+            async with pool.lease(MODEL):
+                raise error
+
+
+def test_bad_requests_do_not_eject_backends():
+    pool = BackendPool([Backend("http://a"), Backend("http://b")])
+    asyncio.run(fail_through(pool, wrapped(TypeError("bad content")), EJECT_AFTER_FAILURES * 3))
+    assert all(b.available and b.consecutive_failures == 0 for b in pool.backends)
+
+
+def test_transport_failures_eject_backend():
+    backend = Backend("http://a")
+    pool = BackendPool([backend])
+    asyncio.run(fail_through(pool, wrapped(httpx.ConnectError("refused")), EJECT_AFTER_FAILURES))
+    assert backend.ejected
+    assert pool.snapshot()[0]["status"] == "ejected"
+
+
+def test_latency_is_scored_per_generated_token():
+    backend = Backend("http://a")
+    pool = BackendPool([backend])
+
+    async def call(tokens):
+        async with pool.lease(MODEL) as lease:
+            lease.started -= 2.0  # pretend the call took two seconds
+            lease.completed(tokens)
+
+    asyncio.run(call(100))
+    assert backend.latency_ewma == pytest.approx(0.02, rel=0.05)
+    asyncio.run(call(None))  # no token count, no latency sample
+    assert backend.latency_ewma == pytest.approx(0.02, rel=0.05)
+
+
+def test_lane_limit_scales_with_available_backends():
+    backends = [Backend("http://a"), Backend("http://b"), Backend("http://c", ["mistral"])]
+    pool = BackendPool(backends)
+    limiter = ModelLimiter(max_concurrency=2, max_queue=0, capacity=pool.capacity)
+
+    async def scenario():
+        leases = [await limiter.acquire(MODEL) for _ in range(4)]
+        with pytest.raises(Saturated):
+            await limiter.acquire(MODEL)
+        assert limiter.snapshot()[MODEL] == {"active": 4, "waiting": 0, "limit": 4}
+
+        backends[0].ejected_until = float("inf")
+        for lease in leases:
+            lease.release()
+        await limiter.acquire(MODEL)
+        assert limiter.snapshot()[MODEL]["limit"] == 2
+        # Cloud models are not spread over the Ollama pool.
+        await limiter.acquire("gpt-4-turbo")
+        assert limiter.snapshot()["gpt-4-turbo"]["limit"] == 2
+
+    asyncio.run(scenario())
+
+
+def test_health_probe_does_not_undo_passive_ejection(monkeypatch):
+    import rina_provider_router
+
+    class Transport:
+        client = httpx.AsyncClient(transport=httpx.MockTransport(
+            lambda request: httpx.Response(200, json={"models": [{"name": "llama2:latest"}]})
+        ))
+
+    monkeypatch.setattr(rina_provider_router.transports, "ollama", lambda url: Transport)
+    backend = Backend("http://a")
+    pool = BackendPool([backend])
+
+    async def scenario():
+        await fail_through(pool, wrapped(status_error(500)), EJECT_AFTER_FAILURES)
+        assert backend.ejected
+        await pool.probe(backend)
+        assert backend.healthy and backend.ejected
+        assert backend.models == {"llama2:latest"}
+        # A request that goes through anyway (e.g. no other backend) puts it back.
+        async with pool.lease(MODEL) as lease:
+            lease.completed(10)
+        assert backend.available
+
+    asyncio.run(scenario())
@@ -0,0 +1,169 @@
+import asyncio
+
+import pytest
+
+from rina_engine import ModelLimiter, Saturated
+from rina_quota import MemoryQuotaStore, QuotaExceeded, QuotaManager, QuotaStore, REQUESTS, TOKENS, Tier
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def manager(clock: Clock, rpm: float = 0, tpm: float = 0) -> QuotaManager:
+    tiers = {"community": Tier("community", rpm=rpm, tpm=tpm), "admin": Tier("admin", priority=4)}
+    return QuotaManager(MemoryQuotaStore(clock=clock), tiers, enabled=True)
+
+
+def test_quota_store_is_abstract():
+    with pytest.raises(TypeError):
+        QuotaStore()
+
+
+def test_request_bucket_refills_over_time():
+    clock = Clock()
+    quotas = manager(clock, rpm=60)
+    principal = quotas.principal(client="10.0.0.1")
+
+    async def scenario():
+        for _ in range(60):
+            await quotas.admit(principal)
+        with pytest.raises(QuotaExceeded) as raised:
+            await quotas.admit(principal)
+        assert raised.value.bucket == REQUESTS
+        assert raised.value.retry_after == 1
+        clock.now += 1.0  # one request's worth at 60/min
+        await quotas.admit(principal)
+        with pytest.raises(QuotaExceeded):
+            await quotas.admit(principal)
+
+    asyncio.run(scenario())
+
+
+def test_token_charges_can_go_negative_and_block_until_repaid():
+    clock = Clock()
+    quotas = manager(clock, tpm=600)  # 10 tokens/s
+    principal = quotas.principal(client="10.0.0.2")
+
+    async def scenario():
+        await quotas.admit(principal)
+        await quotas.charge(principal, 5000)  # floors at -600
+        with pytest.raises(QuotaExceeded) as raised:
+            await quotas.admit(principal)
+        assert raised.value.bucket == TOKENS
+        assert raised.value.retry_after == 61  # from -600 back up to 1 token at 10/s
+        clock.now += 60.0
+        with pytest.raises(QuotaExceeded):
+            await quotas.admit(principal)
+        clock.now += 1.0
+        await quotas.admit(principal)
+
+    asyncio.run(scenario())
+
+
+def test_metered_stream_is_charged_as_it_flows():
+    clock = Clock()
+    quotas = manager(clock, tpm=60)
+    principal = quotas.principal(client="10.0.0.3")
+
+    async def tokens():
+        for i in range(100):
+            yield f"t{i}"
+
+    async def scenario():
+        seen = [t async for t in quotas.metered(principal, tokens())]
+        assert len(seen) == 100
+        with pytest.raises(QuotaExceeded):
+            await quotas.admit(principal)
+
+    asyncio.run(scenario())
+
+
+def test_principals_and_disabled_quotas():
+    clock = Clock()
+    quotas = manager(clock, rpm=1)
+    admin = quotas.principal(admin=True)
+    assert admin.tier.name == "admin"
+
+    async def scenario():
+        for _ in range(10):
+            await quotas.admit(admin)  # unlimited tier
+        quotas.enabled = False
+        client = quotas.principal(client="10.0.0.4")
+        for _ in range(10):
+            await quotas.admit(client)
+
+    asyncio.run(scenario())
+
+
+def test_lower_tiers_are_shed_first_when_the_queue_is_full():
+    limiter = ModelLimiter(max_concurrency=1, max_queue=1, queue_timeout=5)
+
+    async def scenario():
+        held = await limiter.acquire("m", priority=2)
+        community = asyncio.ensure_future(limiter.acquire("m", priority=0))
+        await asyncio.sleep(0)
+        enterprise = asyncio.ensure_future(limiter.acquire("m", priority=3))
+        await asyncio.sleep(0)
+
+        with pytest.raises(Saturated) as raised:
+            await community
+        assert raised.value.status_code == 429
+
+        # A newcomer that outranks nobody in the full queue is turned away itself.
+        with pytest.raises(Saturated):
+            await limiter.acquire("m", priority=1)
+
+        held.release()
+        lease = await enterprise
+        assert limiter.snapshot()["m"] == {"active": 1, "waiting": 0, "limit": 1}
+        lease.release()
+
+    asyncio.run(scenario())
+
+
+def test_waiters_are_served_by_priority_then_arrival():
+    limiter = ModelLimiter(max_concurrency=1, max_queue=8, queue_timeout=5)
+    order = []
+
+    async def wait(name, priority):
+        lease = await limiter.acquire("m", priority)
+        order.append(name)
+        lease.release()
+
+    async def scenario():
+        held = await limiter.acquire("m")
+        tasks = []
+        for name, priority in (("low-1", 0), ("high", 3), ("low-2", 0), ("mid", 1)):
+            tasks.append(asyncio.ensure_future(wait(name, priority)))
+            await asyncio.sleep(0)
+        held.release()
+        await asyncio.gather(*tasks)
+
+    asyncio.run(scenario())
+    assert order == ["high", "mid", "low-1", "low-2"]
+
+
+def test_invalid_requests_do_not_use_up_the_request_quota(monkeypatch):
+    from fastapi.testclient import TestClient
+
+    import server
+
+    quotas = manager(Clock(), rpm=2)
+    monkeypatch.setattr(server, "quotas", quotas)
+    client = TestClient(server.app)
+
+    for _ in range(5):
+        assert client.post("/chat", json={"content": 5}).status_code == 400
+        assert client.post("/chat", json={"content": "hi", "session_id": "nope"}).status_code == 404
+        assert client.get("/sse", params={"content": "hi", "session_id": "nope"}).status_code == 404
+    # Both requests are still available.
+    principal = quotas.principal(client="testclient")
+    asyncio.run(quotas.admit(principal))
+    asyncio.run(quotas.admit(principal))
+    with pytest.raises(QuotaExceeded):
+        asyncio.run(quotas.admit(principal))
@@ -0,0 +1,84 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+import rina_sessions
+import server
+from rina_engine import model_limiter
+
+
+@pytest.mark.parametrize("content", [5, 1.5, True, {"text": "hi"}, [5], [{"type": "audio", "data": "..."}]])
+def test_non_text_content_is_rejected(content):
+    with pytest.raises(HTTPException) as raised:
+        asyncio.run(server.resolve_prompt(None, None, [{"role": "user", "content": content}]))
+    assert raised.value.status_code == 400
+    with pytest.raises(HTTPException):
+        asyncio.run(server.resolve_prompt(None, content))
+
+
+def test_text_and_image_parts_are_accepted():
+    parts = [{"type": "text", "text": "what is this?"},
+             {"type": "image_url", "image_url": {"url": "data:image/png;base64,AAAA"}}]
+    _, prompt = asyncio.run(server.resolve_prompt(None, None, [{"role": "user", "content": parts}]))
+    assert prompt == [{"role": "user", "content": parts}]
+    _, prompt = asyncio.run(server.resolve_prompt(None, "hello"))
+    assert prompt == [{"role": "user", "content": "hello"}]
+
+
+def test_summaries_are_tracked_and_take_a_model_slot(monkeypatch):
+    monkeypatch.setattr(rina_sessions, "SUMMARIZE", True)
+    seen = {}
+
+    async def fake_summarize(summary, turns, model, timeout=None):
+        seen["active"] = model_limiter.snapshot()[model]["active"]
+        await asyncio.sleep(0.05)
+        return "summary"
+
+    monkeypatch.setattr(rina_sessions, "rina_summarize", fake_summarize)
+
+    async def scenario():
+        store = rina_sessions.ConversationStore()
+        session = store.create()
+        store.prepare(session, [{"role": "user", "content": "x" * 4000} for _ in range(4)])
+        assert len(store._summaries) == 1
+        await asyncio.gather(*store._summaries)
+        return store, session
+
+    store, session = asyncio.run(scenario())
+    assert seen["active"] == 1
+    assert session.summary == "summary"
+    assert not store._summaries
+    assert model_limiter.snapshot()[rina_sessions.SUMMARY_MODEL]["active"] == 0
+
+
+def test_resent_system_prompt_does_not_grow_the_session():
+    store = rina_sessions.ConversationStore()
+    session = store.create()
+    system = {"role": "system", "content": "You are a helpful terminal assistant. " * 20}
+    for i in range(300):
+        window = store.prepare(session, [system, {"role": "user", "content": f"question {i}"}])
+        store.record_reply(session, f"answer {i}")
+    assert len(session.system) == 1
+    assert sum(1 for m in window if m["role"] == "system") == 1
+    assert sum(rina_sessions.estimate_tokens(m["content"]) + 4 for m in window) <= rina_sessions.CONTEXT_TOKENS
+    assert window[-1] == {"role": "user", "content": "question 299"}
+
+    # A changed system prompt replaces the old one.
+    window = store.prepare(session, [{"role": "system", "content": "Be brief."}, {"role": "user", "content": "hi"}])
+    assert [m for m in window if m["role"] == "system"] == [{"role": "system", "content": "Be brief."}]
+
+
+def test_system_turns_count_against_the_budget():
+    turns = [rina_sessions.Turn("system", "s" * 400) for _ in range(10)]
+    latest = rina_sessions.Turn("user", "hello")
+    window, _ = rina_sessions.build_window(turns, "", [latest], budget=300)
+    assert [m["role"] for m in window] == ["system", "system", "user"]
+
+
+def test_stateless_history_dedupes_repeated_system_prompts():
+    history = []
+    for i in range(50):
+        history += [{"role": "system", "content": "Be brief."}, {"role": "user", "content": f"q{i}"}]
+    window = rina_sessions.context_window(history)
+    assert sum(1 for m in window if m["role"] == "system") == 1
@@ -0,0 +1,139 @@
+import asyncio
+
+import server
+from rina_engine import model_limiter
+from rina_singleflight import stream_flights
+from rina_ws import WebSocketMultiplexer
+
+MODEL = server.get_model("local")
+
+
+class SlowUpstream:
+    def __init__(self):
+        self.started = 0
+        self.closed = 0
+
+    async def stream(self, prompt, model="ollama/llama2"):
+        self.started += 1
+        try:
+            while True:
+                await asyncio.sleep(0.01)
+                yield "tok "
+        finally:
+            self.closed += 1
+
+
+def lane_idle() -> bool:
+    return model_limiter.snapshot().get(MODEL, {"active": 0})["active"] == 0 and not stream_flights._flights
+
+
+def test_unread_subscription_releases_the_slot(monkeypatch):
+    upstream = SlowUpstream()
+    monkeypatch.setattr(server, "rina_ollama_stream", upstream.stream)
+
+    async def scenario():
+        principal = server.quotas.principal(client="127.0.0.1")
+        async with server.open_generation(principal, None, MODEL, [{"role": "user", "content": "never read"}]):
+            pass
+        await asyncio.sleep(0.05)
+
+    asyncio.run(scenario())
+    assert lane_idle()
+    assert upstream.closed == upstream.started
+
+
+class StuckWebSocket:
+    """Accepts frames but never drains the outbox."""
+
+    async def send_text(self, text):
+        await asyncio.Event().wait()
+
+
+def test_ws_cancel_while_sending_start_releases_the_stream(monkeypatch):
+    upstream = SlowUpstream()
+    monkeypatch.setattr(server, "rina_ollama_stream", upstream.stream)
+    principal = server.quotas.principal(client="127.0.0.1")
+
+    def open_stream(frame):
+        return server.open_generation(principal, None, MODEL, [{"role": "user", "content": frame["content"]}])
+
+    async def scenario():
+        mux = WebSocketMultiplexer(StuckWebSocket(), open_stream)
+        mux._outbox = asyncio.Queue(1)
+        mux._outbox.put_nowait({"type": "filler"})  # full, so send({"type": "start"}) blocks
+        task = asyncio.ensure_future(mux._generate("r1", {"content": "blocked on start"}))
+        await asyncio.sleep(0.05)
+        assert stream_flights._flights
+        mux._closed = True
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        await asyncio.sleep(0.05)
+
+    asyncio.run(scenario())
+    assert lane_idle()
+    assert upstream.closed == upstream.started == 1
+
+
+def test_sse_response_never_sent_holds_nothing(monkeypatch):
+    upstream = SlowUpstream()
+    monkeypatch.setattr(server, "rina_ollama_stream", upstream.stream)
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+        "path": "/sse", "raw_path": b"/sse", "query_string": b"content=client+already+gone", "root_path": "",
+        "headers": [], "client": ("127.0.0.1", 50000), "server": ("127.0.0.1", 7071),
+    }
+
+    async def receive():
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        raise OSError("client went away")
+
+    async def scenario():
+        try:
+            await server.app(scope, receive, send)
+        except Exception:
+            pass
+        await asyncio.sleep(0.05)
+
+    asyncio.run(scenario())
+    assert lane_idle()
+    assert upstream.closed == upstream.started
+
+
+class RecordingWebSocket:
+    def __init__(self):
+        self.frames = []
+
+    async def send_text(self, text):
+        import json
+        self.frames.append(json.loads(text))
+
+
+def test_ws_cancel_mid_stream_reports_cancelled(monkeypatch):
+    upstream = SlowUpstream()
+    monkeypatch.setattr(server, "rina_ollama_stream", upstream.stream)
+    principal = server.quotas.principal(client="127.0.0.1")
+
+    def open_stream(frame):
+        return server.open_generation(principal, None, MODEL, [{"role": "user", "content": frame["content"]}])
+
+    async def scenario():
+        websocket = RecordingWebSocket()
+        mux = WebSocketMultiplexer(websocket, open_stream)
+        writer = asyncio.ensure_future(mux._write_loop())
+        await mux._dispatch({"type": "generate", "id": "a", "content": "cancel me mid-stream"})
+        while not any(f["type"] == "token" for f in websocket.frames):
+            await asyncio.sleep(0.01)
+        await mux._dispatch({"type": "cancel", "id": "a"})
+        while not any(f["type"] in ("done", "error") for f in websocket.frames):
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.05)
+        writer.cancel()
+        return websocket.frames
+
+    frames = asyncio.run(scenario())
+    assert frames[-1] == {"type": "done", "id": "a", "finish_reason": "cancelled"}
+    assert not any(f["type"] == "error" for f in frames)
+    assert lane_idle()
+    assert upstream.closed == upstream.started == 1
@@ -0,0 +1,26 @@
+import contextvars
+
+import rina_telemetry as telemetry
+from server import get_model
+
+
+def timer_provider(requested, model):
+    def run():
+        if requested is not None:
+            telemetry.provider.set(requested)
+        return telemetry.GenerationTimer(model).provider
+
+    return contextvars.copy_context().run(run)
+
+
+def test_bare_model_names_take_the_requested_provider():
+    assert timer_provider("anthropic", get_model("anthropic")) == "anthropic"
+    assert timer_provider("groq", get_model("groq")) == "groq"
+    assert timer_provider("openai", get_model("openai")) == "openai"
+
+
+def test_prefixed_model_names_keep_their_prefix():
+    # "local" and unknown providers resolve to ollama models
+    assert timer_provider("local", get_model("local")) == "ollama"
+    assert timer_provider("made-up", get_model("made-up")) == "ollama"
+    assert timer_provider(None, "gpt-4-turbo") == "unknown"
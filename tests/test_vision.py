@@ -0,0 +1,40 @@
+import asyncio
+import base64
+import io
+
+import pytest
+from PIL import Image
+
+import rina_vision
+
+
+def png(width: int, height: int) -> bytearray:
+    out = io.BytesIO()
+    Image.new("RGB", (width, height), (200, 30, 30)).save(out, format="PNG")
+    return bytearray(out.getvalue())
+
+
+@pytest.mark.parametrize("size", [0, 1, 2, 3, rina_vision._ENCODE_CHUNK - 1, rina_vision._ENCODE_CHUNK * 2 + 1])
+def test_data_uri_matches_plain_base64(size):
+    data = bytes(range(256)) * (size // 256 + 1)
+    data = data[:size]
+    assert rina_vision._encode_data_uri(data, "image/png") == b"data:image/png;base64," + base64.b64encode(data)
+
+
+def test_small_image_passes_through_and_buffer_is_released():
+    data = png(32, 32)
+    original = bytes(data)
+    uri = asyncio.run(rina_vision.prepare_image(data, "image/png"))
+    assert uri == "data:image/png;base64," + base64.b64encode(original).decode()
+    assert len(data) == 0
+
+
+def test_oversize_image_is_downscaled(monkeypatch):
+    monkeypatch.setattr(rina_vision, "MAX_DIMENSION", 64)
+    data = png(300, 150)
+    uri = asyncio.run(rina_vision.prepare_image(data, "image/png"))
+    mime, _, encoded = uri.partition(";base64,")
+    assert mime == "data:image/jpeg"
+    with Image.open(io.BytesIO(base64.b64decode(encoded))) as image:
+        assert image.size == (64, 32)
+    assert len(data) == 0